@@ -2,24 +2,49 @@ import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 
+from api.modules.sync_jobs import SyncJobManager
+from api.utils.auth import get_api_secret
+from api.utils.auth_cache import create_auth_cache
 from api.utils.db import MongoDbManager
-from api.utils.logger import LoggingMiddleware
+from api.utils.logger import LoggingMiddleware, get_logger
+from api.utils.routemap_cache import create_routemap_cache
+from api.utils.strava_client import StravaHttpClient
+from api.utils.strava_webhook import check_webhook_config
 from api.utils.version import get_version
-from api.routers import auth, ui, routes
+from api.routers import auth, diagnostics, ui, routes, webhooks
 
 load_dotenv()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    try:
+        get_api_secret()
+    except ValueError as e:
+        get_logger().error(f"API keys can not be hashed: {str(e)}")
+    try:
+        check_webhook_config()
+    except ValueError as e:
+        get_logger().error(f"Strava webhook is not fully configured: {str(e)}")
+    app.state.auth_cache = create_auth_cache()
     db_manager = MongoDbManager()
     db = await db_manager.connect()
     app.state.db = db
+    strava_client = StravaHttpClient()
+    app.state.strava_client = strava_client
+    routemap_cache = create_routemap_cache(db)
+    app.state.routemap_cache = routemap_cache
+    sync_job_manager = SyncJobManager(db, strava_client, routemap_cache)
+    await sync_job_manager.start()
+    app.state.sync_job_manager = sync_job_manager
 
     yield
 
+    await sync_job_manager.close()
+    await strava_client.close()
     await db_manager.close()
 
 
@@ -37,10 +62,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Routemap-Count",
+        "X-Routemap-Precision",
+        "X-Routemap-Weighted",
+        "X-Routemap-Max-Weight",
+        "X-Routemap-Activity-Count",
+        "X-Routemap-Types",
+    ],
 )
 
+# Compress responses of clients sending 'Accept-Encoding: gzip', routemaps shrink several times
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+
 app.add_middleware(LoggingMiddleware)
 
 app.include_router(ui.router)
 app.include_router(auth.router)
 app.include_router(routes.router)
+app.include_router(webhooks.router)
+app.include_router(diagnostics.router)
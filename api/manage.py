@@ -0,0 +1,388 @@
+"""
+Maintenance commands for the API database.
+
+Usage:
+    python -m api.manage explain [--user-id USER_ID]
+    python -m api.manage encode-routes [--batch-size BATCH_SIZE]
+    python -m api.manage backfill-cells [--batch-size BATCH_SIZE]
+    python -m api.manage build-buckets [--user-id USER_ID]
+    python -m api.manage simplify-routes [--tolerance METERS] [--batch-size BATCH_SIZE] [--apply]
+    python -m api.manage simulate-webhook --activity-id ACTIVITY_ID [--aspect create|update|delete] [--user-id USER_ID] [--owner-id ATHLETE_ID] [--url API_URL]
+"""
+
+import argparse
+import asyncio
+import time
+import httpx
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from api.modules.routemap_buckets import rebuild_buckets
+from api.types.common import AsyncDatabase
+from api.types.webhooks import (
+    StravaWebhookEvent,
+    WebhookAspectType,
+    WebhookObjectType,
+)
+from api.utils.db import DbCollection, MongoDbManager
+from api.modules.query_plans import explain_hot_queries
+from api.utils.strava_webhook import (
+    get_webhook_path_secret,
+    get_webhook_subscription_id,
+    webhooks_enabled,
+)
+from api.utils.routemap import (
+    cells_field,
+    compute_activity_cells,
+    compute_route_bounds,
+    encode_route,
+    get_activity_cells,
+    get_cell_precisions,
+    get_route_coordinates,
+    get_route_simplify_tolerance,
+    simplify_route,
+)
+
+ROUTE_PROJECTION = {"_id": 1, "route": 1, "route_encoded": 1}
+
+
+async def explain(db: AsyncDatabase, args: argparse.Namespace):
+    users_collection = db.get_collection(DbCollection.USERS)
+    user_filter = {"id": args.user_id} if args.user_id else {}
+    user = await users_collection.find_one(user_filter)
+    if not user:
+        print("No user found to explain the queries with.")
+        return
+
+    print(f"Query plans for user {user['username']} ({user['id']}):")
+    for report in await explain_hot_queries(db, user):
+        status = (
+            "COVERED"
+            if report.covered
+            else "COLLECTION SCAN" if report.collection_scan else "INDEXED"
+        )
+        print(f"\n[{status}] {report.name}")
+        print(f"  collection: {report.collection}")
+        print(f"  filter:     {report.filter}")
+        print(f"  indexes:    {', '.join(report.indexes) or '-'}")
+        print(f"  stages:     {' <- '.join(report.stages)}")
+        print(
+            f"  examined:   {report.keys_examined} keys, {report.docs_examined} docs for {report.returned} results"
+        )
+
+
+async def print_activities_stats(db: AsyncDatabase, label: str):
+    stats = await db.command("collStats", DbCollection.ACTIVITIES.value)
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+
+    start = time.perf_counter()
+    point_count = 0
+    async for activity in activities_collection.find({}, ROUTE_PROJECTION):
+        point_count += len(get_route_coordinates(activity))
+    read_seconds = time.perf_counter() - start
+
+    print(
+        f"{label}: {stats['count']} activities, data size {stats['size'] / 1024**2:.1f} MB, "
+        f"storage size {stats['storageSize'] / 1024**2:.1f} MB, "
+        f"read and decoded {point_count} points in {read_seconds:.2f}s"
+    )
+
+
+async def encode_routes(db: AsyncDatabase, args: argparse.Namespace):
+    """
+    Convert activities stored with a `route` coordinate array to the binary `route_encoded` format.
+    """
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    await print_activities_stats(db, "Before")
+
+    converted_count = 0
+    operations = []
+    cursor = activities_collection.find(
+        {"route": {"$type": "array"}}, {"_id": 1, "route": 1}
+    ).batch_size(args.batch_size)
+    async for activity in cursor:
+        operations.append(
+            UpdateOne(
+                {"_id": activity["_id"]},
+                {
+                    "$set": {"route_encoded": encode_route(activity["route"])},
+                    "$unset": {"route": ""},
+                },
+            )
+        )
+        if len(operations) >= args.batch_size:
+            await activities_collection.bulk_write(operations, ordered=False)
+            converted_count += len(operations)
+            operations = []
+            print(f"Converted {converted_count} activities...")
+
+    if operations:
+        await activities_collection.bulk_write(operations, ordered=False)
+        converted_count += len(operations)
+
+    print(f"Converted {converted_count} activities to binary routes.")
+    await print_activities_stats(db, "After")
+
+
+async def backfill_cells(db: AsyncDatabase, args: argparse.Namespace):
+    """
+    Precompute the grid cells and bounds of activities synced before they were stored at sync time.
+    """
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    missing_cells = {
+        "$or": [
+            {f"cells.{cells_field(precision)}": {"$exists": False}}
+            for precision in get_cell_precisions()
+        ]
+        + [{"bounds": {"$exists": False}}]
+    }
+
+    updated_count = 0
+    operations: list[UpdateOne] = []
+    cursor = activities_collection.find(missing_cells, ROUTE_PROJECTION).batch_size(
+        args.batch_size
+    )
+    async for activity in cursor:
+        route = get_route_coordinates(activity)
+        operations.append(
+            UpdateOne(
+                {"_id": activity["_id"]},
+                {
+                    "$set": {
+                        "cells": compute_activity_cells(route),
+                        "bounds": compute_route_bounds(route),
+                    }
+                },
+            )
+        )
+        if len(operations) >= args.batch_size:
+            await activities_collection.bulk_write(operations, ordered=False)
+            updated_count += len(operations)
+            operations = []
+            print(f"Backfilled {updated_count} activities...")
+
+    if operations:
+        await activities_collection.bulk_write(operations, ordered=False)
+        updated_count += len(operations)
+
+    print(f"Backfilled cells and bounds of {updated_count} activities.")
+
+
+async def build_buckets(db: AsyncDatabase, args: argparse.Namespace):
+    """
+    Build the monthly routemap buckets from the stored activities, for one or every user.
+    """
+    user_filter = {"id": args.user_id} if args.user_id else {}
+    user_count = 0
+    async for user in db.get_collection(DbCollection.USERS).find(
+        user_filter, {"id": 1, "username": 1}
+    ):
+        print(
+            f"Building routemap buckets for user {user['username']} ({user['id']})..."
+        )
+        await rebuild_buckets(db, user["id"])
+        user_count += 1
+    print(f"Built routemap buckets for {user_count} users.")
+
+
+async def simplify_routes(db: AsyncDatabase, args: argparse.Namespace):
+    """
+    Report the point reduction and processing time of simplifying the stored routes,
+    and with `--apply` store the simplified routes in their current format.
+    The routemap is built from the precomputed cells, so activities missing cells or bounds
+    get them computed from every point before their route is simplified.
+    """
+    tolerance = (
+        args.tolerance if args.tolerance is not None else get_route_simplify_tolerance()
+    )
+    if tolerance <= 0:
+        print("Set a positive --tolerance or ROUTE_SIMPLIFY_TOLERANCE_M.")
+        return
+
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    activity_count = 0
+    points_before = 0
+    points_after = 0
+    simplify_seconds = 0.0
+    backfilled_count = 0
+    precisions = get_cell_precisions()
+    operations: list[UpdateOne] = []
+    cursor = activities_collection.find(
+        {},
+        {
+            **ROUTE_PROJECTION,
+            **{f"cells.{cells_field(precision)}": 1 for precision in precisions},
+            "bounds": 1,
+        },
+    ).batch_size(args.batch_size)
+    async for activity in cursor:
+        route = get_route_coordinates(activity)
+        start = time.perf_counter()
+        simplified = simplify_route(route, tolerance)
+        simplify_seconds += time.perf_counter() - start
+        activity_count += 1
+        points_before += len(route)
+        points_after += len(simplified)
+
+        if args.apply and len(simplified) < len(route):
+            stored_route = (
+                {"route_encoded": encode_route(simplified)}
+                if activity.get("route_encoded") is not None
+                else {"route": simplified.tolist()}
+            )
+            if activity.get("bounds") is None or any(
+                get_activity_cells(activity, precision) is None
+                for precision in precisions
+            ):
+                stored_route["cells"] = compute_activity_cells(route)
+                stored_route["bounds"] = compute_route_bounds(route)
+                backfilled_count += 1
+            operations.append(
+                UpdateOne({"_id": activity["_id"]}, {"$set": stored_route})
+            )
+            if len(operations) >= args.batch_size:
+                await activities_collection.bulk_write(operations, ordered=False)
+                operations = []
+
+    if operations:
+        await activities_collection.bulk_write(operations, ordered=False)
+
+    reduction = 1 - points_after / points_before if points_before else 0
+    print(
+        f"Simplified {activity_count} routes with a {tolerance:g}m tolerance: "
+        f"{points_before} -> {points_after} points ({reduction:.1%} fewer) "
+        f"in {simplify_seconds:.2f}s"
+        + (
+            f", simplified routes stored (cells and bounds backfilled for {backfilled_count})."
+            if args.apply
+            else ", nothing stored."
+        )
+    )
+
+
+async def simulate_webhook(db: AsyncDatabase, args: argparse.Namespace):
+    """
+    Post a Strava webhook activity event to a running API, standing in for Strava during local development.
+    Unless `--owner-id` is given, the athlete is read from the sync metadata of the user.
+    The event is posted to the secret callback path under `--url`, the base URL of the API.
+    """
+    if not webhooks_enabled():
+        print(
+            "The Strava webhook is not enabled, set STRAVA_WEBHOOK_VERIFY_TOKEN, "
+            "STRAVA_WEBHOOK_SUBSCRIPTION_ID and STRAVA_WEBHOOK_PATH_SECRET."
+        )
+        return
+    owner_id = args.owner_id
+    if owner_id is None:
+        sync_filter = (
+            {"user_id": args.user_id} if args.user_id else {"athlete_id": {"$ne": None}}
+        )
+        sync_data = await db.get_collection(DbCollection.SYNC_METADATA).find_one(
+            sync_filter, {"athlete_id": 1}
+        )
+        if not sync_data or sync_data.get("athlete_id") is None:
+            print("No synced athlete found, sync the user first or pass --owner-id.")
+            return
+        owner_id = sync_data["athlete_id"]
+
+    event = StravaWebhookEvent(
+        object_type=WebhookObjectType.ACTIVITY,
+        object_id=args.activity_id,
+        aspect_type=WebhookAspectType(args.aspect),
+        owner_id=owner_id,
+        subscription_id=get_webhook_subscription_id(),
+        event_time=int(time.time()),
+    )
+    url = f"{args.url.rstrip('/')}/strava/webhook/{get_webhook_path_secret()}"
+    async with httpx.AsyncClient() as client:
+        response = await client.post(url, json=event.model_dump(mode="json"))
+    print(
+        f"Posted {args.aspect} event of activity {args.activity_id} (athlete {owner_id}) to {args.url}: "
+        f"{response.status_code} {response.text}"
+    )
+
+
+COMMANDS = {
+    "explain": explain,
+    "encode-routes": encode_routes,
+    "backfill-cells": backfill_cells,
+    "build-buckets": build_buckets,
+    "simplify-routes": simplify_routes,
+    "simulate-webhook": simulate_webhook,
+}
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m api.manage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    explain_parser = subparsers.add_parser(
+        "explain", help="Explain the hot queries and report whether they use indexes"
+    )
+    explain_parser.add_argument("--user-id", help="User to build the queries for")
+
+    encode_parser = subparsers.add_parser(
+        "encode-routes", help="Convert stored routes to the compact binary format"
+    )
+    encode_parser.add_argument("--batch-size", type=int, default=200)
+
+    backfill_cells_parser = subparsers.add_parser(
+        "backfill-cells",
+        help="Precompute the grid cells and bounds of already synced activities",
+    )
+    backfill_cells_parser.add_argument("--batch-size", type=int, default=200)
+
+    build_buckets_parser = subparsers.add_parser(
+        "build-buckets", help="Build the monthly routemap buckets from the activities"
+    )
+    build_buckets_parser.add_argument("--user-id", help="Only build for this user")
+
+    simplify_parser = subparsers.add_parser(
+        "simplify-routes",
+        help="Measure, and optionally store, the line simplification of stored routes",
+    )
+    simplify_parser.add_argument(
+        "--tolerance",
+        type=float,
+        help="Tolerance in meters, defaults to ROUTE_SIMPLIFY_TOLERANCE_M",
+    )
+    simplify_parser.add_argument("--batch-size", type=int, default=200)
+    simplify_parser.add_argument(
+        "--apply", action="store_true", help="Store the simplified routes"
+    )
+
+    webhook_parser = subparsers.add_parser(
+        "simulate-webhook",
+        help="Post a Strava webhook activity event to a running API",
+    )
+    webhook_parser.add_argument("--activity-id", type=int, required=True)
+    webhook_parser.add_argument(
+        "--aspect",
+        choices=[aspect.value for aspect in WebhookAspectType],
+        default=WebhookAspectType.CREATE.value,
+    )
+    webhook_parser.add_argument(
+        "--user-id", help="User whose athlete owns the activity"
+    )
+    webhook_parser.add_argument(
+        "--owner-id",
+        type=int,
+        help="Athlete id, instead of reading it from the sync metadata",
+    )
+    webhook_parser.add_argument(
+        "--url", default="http://localhost:8000", help="Base URL of the API"
+    )
+
+    args = parser.parse_args()
+
+    db_manager = MongoDbManager()
+    db = await db_manager.connect()
+    try:
+        await COMMANDS[args.command](db, args)
+    finally:
+        await db_manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,12 +3,13 @@ from fastapi import HTTPException, status
 from api.types.auth import RegistrationRequest, RegistrationResponse
 from api.types.common import AsyncDatabase
 from api.utils.auth import generate_alphanumeric_key, hash_api_key
+from api.utils.auth_cache import AuthCache
 from api.utils.db import DbCollection
 from api.utils.logger import get_logger
 
 
 async def register_user(
-    db: AsyncDatabase, data: RegistrationRequest
+    db: AsyncDatabase, data: RegistrationRequest, auth_cache: AuthCache | None = None
 ) -> RegistrationResponse:
     logger = get_logger()
     users_collection = db.get_collection(DbCollection.USERS)
@@ -43,6 +44,10 @@ async def register_user(
         }
     )
 
+    # The new key may have been tried before registration and cached as invalid
+    if auth_cache:
+        auth_cache.invalidate(api_key_hash)
+
     logger.info(f"User registered successfully: {data.email} with API key {api_key}")
 
     return RegistrationResponse(
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from api.types.common import AsyncDatabase
+from api.types.diagnostics import QueryPlanReport
+from api.types.routes import ActivityType, RouteArea
+from api.modules.routes import ROUTEMAP_PROJECTION, build_routes_filter
+from api.utils.db import DbCollection
+
+
+def collect_plan_stages(plan: dict, stages: list[str], indexes: list[str]):
+    """
+    Walk an explain() plan tree and collect the stage names and the indexes used.
+    """
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    if "stage" in plan:
+        stages.append(plan["stage"])
+    if "indexName" in plan:
+        indexes.append(plan["indexName"])
+    for child_key in ["inputStage", "outerStage", "innerStage"]:
+        if child_key in plan:
+            collect_plan_stages(plan[child_key], stages, indexes)
+    for child in plan.get("inputStages", []):
+        collect_plan_stages(child, stages, indexes)
+
+
+async def explain_query(
+    db: AsyncDatabase,
+    name: str,
+    collection_name: DbCollection,
+    filter_query: dict[str, Any],
+    projection: dict[str, Any] | None = None,
+) -> QueryPlanReport:
+    collection = db.get_collection(collection_name)
+    explanation = await collection.find(filter_query, projection).explain()
+
+    stages: list[str] = []
+    indexes: list[str] = []
+    collect_plan_stages(explanation["queryPlanner"]["winningPlan"], stages, indexes)
+    stats = explanation.get("executionStats", {})
+    docs_examined = stats.get("totalDocsExamined", 0)
+
+    return QueryPlanReport(
+        name=name,
+        collection=collection_name.value,
+        filter=str(filter_query),
+        indexes=indexes,
+        stages=stages,
+        collection_scan="COLLSCAN" in stages,
+        covered="COLLSCAN" not in stages
+        and "FETCH" not in stages
+        and docs_examined == 0,
+        keys_examined=stats.get("totalKeysExamined", 0),
+        docs_examined=docs_examined,
+        returned=stats.get("nReturned", 0),
+    )
+
+
+# A hot query: name, collection, filter and projection
+HotQuery = tuple[str, DbCollection, dict[str, Any], dict[str, Any] | None]
+
+
+async def get_hot_queries(db: AsyncDatabase, user: dict) -> list[HotQuery]:
+    """
+    The queries executed on every sync, routes request and authentication,
+    using the given user document for the filter values.
+    """
+    now = datetime.now(timezone.utc)
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    activity_ids = await activities_collection.distinct(
+        "strava_id", {"user_id": user["id"]}
+    )
+    # The area query uses the bounds of the latest activity of the user
+    latest_activity = await activities_collection.find_one(
+        {"user_id": user["id"], "bounds.type": "Polygon"},
+        {"_id": 0, "bounds": 1},
+        sort=[("start_date", -1)],
+    )
+    area = None
+    if latest_activity:
+        ring = latest_activity["bounds"]["coordinates"][0]
+        area = RouteArea(bounds=(ring[0][1], ring[0][0], ring[2][1], ring[2][0]))
+
+    queries: list[HotQuery] = [
+        (
+            "auth_user: user by API key hash",
+            DbCollection.USERS,
+            {"api_key_hash": user["api_key_hash"]},
+            None,
+        ),
+        (
+            "get_routes: all types, last year",
+            DbCollection.ACTIVITIES,
+            build_routes_filter(
+                user["id"], before=now, after=now - timedelta(days=365)
+            ),
+            None,
+        ),
+        (
+            "get_routes: runs, no date range",
+            DbCollection.ACTIVITIES,
+            build_routes_filter(
+                user["id"], before=None, after=None, types=[ActivityType.RUN]
+            ),
+            ROUTEMAP_PROJECTION,
+        ),
+        (
+            "sync_routes: already synced activities",
+            DbCollection.ACTIVITIES,
+            {"user_id": user["id"], "strava_id": {"$in": activity_ids[:200]}},
+            {"_id": 0, "strava_id": 1},
+        ),
+        (
+            "sync_routes: total routes count",
+            DbCollection.ACTIVITIES,
+            {"user_id": user["id"]},
+            {"_id": 0, "user_id": 1},
+        ),
+    ]
+    if area:
+        queries.append(
+            (
+                "get_routes: bounding box of the latest activity",
+                DbCollection.ACTIVITIES,
+                build_routes_filter(user["id"], before=None, after=None, area=area),
+                ROUTEMAP_PROJECTION,
+            )
+        )
+    return queries
+
+
+async def explain_hot_queries(db: AsyncDatabase, user: dict) -> list[QueryPlanReport]:
+    """
+    Run explain() on the hot queries of `get_hot_queries`.
+    """
+    return [
+        await explain_query(db, name, collection_name, filter_query, projection)
+        for name, collection_name, filter_query, projection in await get_hot_queries(
+            db, user
+        )
+    ]
@@ -0,0 +1,350 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from api.types.common import AsyncDatabase
+from api.utils.db import DbCollection
+from api.utils.logger import get_logger
+from api.utils.routemap import (
+    compute_route_cells,
+    decode_cells,
+    decode_weights,
+    encode_cells,
+    encode_weights,
+    get_activity_cells,
+    get_route_coordinates,
+    merge_weighted_cells,
+)
+
+# Fields needed to aggregate an activity into its monthly bucket
+BUCKET_SOURCE_PROJECTION = {
+    "_id": 0,
+    "strava_id": 1,
+    "type": 1,
+    "start_date": 1,
+    "cells": 1,
+    "route": 1,
+    "route_encoded": 1,
+}
+
+
+def as_utc(dt: datetime) -> datetime:
+    """
+    Convert a datetime to UTC. Naive datetimes (e.g. read from MongoDB) are treated as UTC.
+    """
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def month_start(dt: datetime) -> datetime:
+    """
+    First moment of the calendar month (UTC) of a datetime.
+    """
+    return as_utc(dt).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def full_month_range(
+    after: datetime | None, before: datetime | None
+) -> tuple[datetime | None, datetime | None] | None:
+    """
+    The range [start, end) of calendar months completely inside the `after`-`before` (inclusive) filter.
+    A None bound means the range is open on that side. Returns None if no month is fully covered.
+    """
+    start = None
+    if after is not None:
+        after = as_utc(after)
+        start = month_start(after)
+        if start < after:
+            start = next_month(start)
+
+    end = None
+    if before is not None:
+        before = as_utc(before)
+        end = month_start(before)
+        # Start dates have second precision, so a month is covered if `before` reaches its last second
+        if next_month(end) - timedelta(seconds=1) <= before:
+            end = next_month(end)
+
+    if start is not None and end is not None and start >= end:
+        return None
+    return start, end
+
+
+def get_activity_bucket_cells(activity: dict) -> np.ndarray:
+    cells = get_activity_cells(activity)
+    if cells is None:
+        cells = compute_route_cells(get_route_coordinates(activity))
+    return cells
+
+
+def get_bucket_weights(bucket: dict, cell_count: int) -> np.ndarray:
+    """
+    Visit counts of the bucket cells. Buckets built before weights were stored count every cell once.
+    """
+    if bucket.get("weights") is None:
+        return np.ones(cell_count, dtype=np.int64)
+    return decode_weights(bucket["weights"])
+
+
+def merge_bucket_cells(
+    bucket: dict | None, activity_cells: list[np.ndarray]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Merge activity cells into the cells of a bucket, counting the distinct activities per cell.
+    """
+    cells = list(activity_cells)
+    weights = [np.ones(len(activity), dtype=np.int64) for activity in activity_cells]
+    if bucket is not None:
+        bucket_cells = decode_cells(bucket["cells"])
+        cells.append(bucket_cells)
+        weights.append(get_bucket_weights(bucket, len(bucket_cells)))
+    return merge_weighted_cells(cells, weights)
+
+
+def group_activities_by_bucket(
+    activities: list[dict],
+) -> dict[tuple[str, datetime], dict[int, np.ndarray]]:
+    """
+    Cells of the activities by bucket key and Strava id.
+    """
+    buckets: dict[tuple[str, datetime], dict[int, np.ndarray]] = {}
+    for activity in activities:
+        bucket_key = (activity["type"], month_start(activity["start_date"]))
+        buckets.setdefault(bucket_key, {})[activity["strava_id"]] = (
+            get_activity_bucket_cells(activity)
+        )
+    return buckets
+
+
+async def has_routemap_buckets(db: AsyncDatabase, user_id: str) -> bool:
+    """
+    Whether the monthly buckets of the user are complete, i.e. built for every synced activity.
+    """
+    sync_data = await db.get_collection(DbCollection.SYNC_METADATA).find_one(
+        {"user_id": user_id}, {"routemap_buckets": 1}
+    )
+    return bool(sync_data and sync_data.get("routemap_buckets"))
+
+
+async def merge_into_buckets(db: AsyncDatabase, user_id: str, activities: list[dict]):
+    """
+    Merge newly inserted activities into the monthly buckets of their type, then clear their `bucketed` marker.
+    Every bucket is updated with a compare-and-set on its version, so concurrent merges cannot lose cells.
+    Buckets list the activities merged into them and skip those, so merging an activity again, e.g. when
+    retrying after a failure, does not count it twice.
+    """
+    buckets_collection = db.get_collection(DbCollection.ROUTEMAP_BUCKETS)
+    for (activity_type, month), cells_by_id in group_activities_by_bucket(
+        activities
+    ).items():
+        bucket_filter = {"user_id": user_id, "type": activity_type, "month": month}
+        while True:
+            bucket = await buckets_collection.find_one(bucket_filter)
+            if bucket is not None and bucket.get("strava_ids") is None:
+                # Buckets built before they listed their activities can not tell which are merged already
+                await rebuild_activity_buckets(
+                    db, user_id, [{"type": activity_type, "start_date": month}]
+                )
+                continue
+            merged_ids = set(bucket["strava_ids"]) if bucket else set()
+            activity_cells = [
+                cells
+                for strava_id, cells in cells_by_id.items()
+                if strava_id not in merged_ids
+            ]
+            if not activity_cells:
+                break
+            cells, weights = merge_bucket_cells(bucket, activity_cells)
+            strava_ids = sorted(merged_ids | cells_by_id.keys())
+            version = bucket["version"] if bucket else 0
+            try:
+                result = await buckets_collection.update_one(
+                    (
+                        {**bucket_filter, "version": version}
+                        if bucket
+                        # Creating: matches no existing bucket, so losing the race raises DuplicateKeyError
+                        else {**bucket_filter, "version": {"$exists": False}}
+                    ),
+                    {
+                        "$set": {
+                            "cells": encode_cells(cells),
+                            "weights": encode_weights(weights),
+                            "activity_count": len(strava_ids),
+                            "strava_ids": strava_ids,
+                            "version": version + 1,
+                            "updated_at": datetime.now(timezone.utc),
+                        }
+                    },
+                    upsert=bucket is None,
+                )
+            except DuplicateKeyError:
+                # Another merge created the bucket in the meantime
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                break
+
+    await db.get_collection(DbCollection.ACTIVITIES).update_many(
+        {
+            "user_id": user_id,
+            "strava_id": {"$in": [activity["strava_id"] for activity in activities]},
+            "bucketed": False,
+        },
+        {"$unset": {"bucketed": ""}},
+    )
+
+
+async def merge_pending_activities(db: AsyncDatabase, user_id: str) -> int:
+    """
+    Merge the activities still marked with `bucketed: False`, i.e. stored but not merged into their buckets
+    because the merge failed or the process stopped in between. Returns the number of merged activities.
+    """
+    pending = [
+        activity
+        async for activity in db.get_collection(DbCollection.ACTIVITIES).find(
+            {"user_id": user_id, "bucketed": False}, BUCKET_SOURCE_PROJECTION
+        )
+    ]
+    if pending:
+        get_logger().info(
+            f"Merging {len(pending)} activities of user {user_id} missing from the routemap buckets."
+        )
+        await merge_into_buckets(db, user_id, pending)
+    return len(pending)
+
+
+async def rebuild_buckets(db: AsyncDatabase, user_id: str):
+    """
+    Rebuild every monthly bucket of a user from the stored activities, then mark the buckets complete.
+    """
+    logger = get_logger()
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    buckets_collection = db.get_collection(DbCollection.ROUTEMAP_BUCKETS)
+
+    grouped: dict[tuple[str, datetime], dict[int, np.ndarray]] = {}
+    async for activity in activities_collection.find(
+        {"user_id": user_id}, BUCKET_SOURCE_PROJECTION
+    ):
+        for bucket_key, cells_by_id in group_activities_by_bucket([activity]).items():
+            grouped.setdefault(bucket_key, {}).update(cells_by_id)
+
+    await buckets_collection.delete_many({"user_id": user_id})
+    now = datetime.now(timezone.utc)
+    operations = []
+    for (activity_type, month), cells_by_id in grouped.items():
+        cells, weights = merge_bucket_cells(None, list(cells_by_id.values()))
+        operations.append(
+            UpdateOne(
+                {"user_id": user_id, "type": activity_type, "month": month},
+                {
+                    "$set": {
+                        "cells": encode_cells(cells),
+                        "weights": encode_weights(weights),
+                        "activity_count": len(cells_by_id),
+                        "strava_ids": sorted(cells_by_id),
+                        "version": 1,
+                        "updated_at": now,
+                    }
+                },
+                upsert=True,
+            )
+        )
+    if operations:
+        await buckets_collection.bulk_write(operations, ordered=False)
+
+    await activities_collection.update_many(
+        {"user_id": user_id, "bucketed": False}, {"$unset": {"bucketed": ""}}
+    )
+    await db.get_collection(DbCollection.SYNC_METADATA).update_one(
+        {"user_id": user_id}, {"$set": {"routemap_buckets": True}}, upsert=True
+    )
+    logger.info(f"Rebuilt {len(operations)} routemap buckets for user {user_id}.")
+
+
+async def rebuild_activity_buckets(
+    db: AsyncDatabase, user_id: str, activities: list[dict]
+):
+    """
+    Rebuild the monthly buckets the activities belong to from the stored activities,
+    e.g. after the activities were deleted or their type changed. Empty buckets are removed.
+    """
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    buckets_collection = db.get_collection(DbCollection.ROUTEMAP_BUCKETS)
+    bucket_keys = {
+        (activity["type"], month_start(activity["start_date"]))
+        for activity in activities
+    }
+    for activity_type, month in bucket_keys:
+        bucket_filter = {"user_id": user_id, "type": activity_type, "month": month}
+        while True:
+            bucket = await buckets_collection.find_one(bucket_filter, {"version": 1})
+            cells_by_id = {
+                activity["strava_id"]: get_activity_bucket_cells(activity)
+                async for activity in activities_collection.find(
+                    {
+                        "user_id": user_id,
+                        "type": activity_type,
+                        "start_date": {"$gte": month, "$lt": next_month(month)},
+                    },
+                    BUCKET_SOURCE_PROJECTION,
+                )
+            }
+            version = bucket["version"] if bucket else 0
+            if not cells_by_id:
+                if bucket is not None:
+                    result = await buckets_collection.delete_one(
+                        {**bucket_filter, "version": version}
+                    )
+                    if not result.deleted_count:
+                        # A merge changed the bucket in the meantime
+                        continue
+                break
+
+            cells, weights = merge_bucket_cells(None, list(cells_by_id.values()))
+            try:
+                result = await buckets_collection.update_one(
+                    (
+                        {**bucket_filter, "version": version}
+                        if bucket
+                        # Creating: matches no existing bucket, so losing the race raises DuplicateKeyError
+                        else {**bucket_filter, "version": {"$exists": False}}
+                    ),
+                    {
+                        "$set": {
+                            "cells": encode_cells(cells),
+                            "weights": encode_weights(weights),
+                            "activity_count": len(cells_by_id),
+                            "strava_ids": sorted(cells_by_id),
+                            "version": version + 1,
+                            "updated_at": datetime.now(timezone.utc),
+                        }
+                    },
+                    upsert=bucket is None,
+                )
+            except DuplicateKeyError:
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                break
+
+
+def build_bucket_filter(
+    user_id: str,
+    types: list[str],
+    month_range: tuple[datetime | None, datetime | None],
+) -> dict[str, Any]:
+    start, end = month_range
+    bucket_filter: dict[str, Any] = {"user_id": user_id, "type": {"$in": types}}
+    month_filter = {}
+    if start is not None:
+        month_filter["$gte"] = start
+    if end is not None:
+        month_filter["$lt"] = end
+    if month_filter:
+        bucket_filter["month"] = month_filter
+    return bucket_filter
@@ -1,21 +1,203 @@
-from typing import Any
+import asyncio
+import os
+import orjson
+from typing import Any, AsyncIterator, Awaitable, Callable
 import uuid
-from datetime import datetime, timezone
-from fastapi import HTTPException, status
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from pymongo import UpdateOne
 from api.types.auth import User
 from api.types.common import AsyncDatabase
-from api.types.routes import ActivityType, Routemap, RoutesResponse, SyncResponse
+from api.types.routes import (
+    ActivityType,
+    RouteArea,
+    SyncResponse,
+    SyncStageStats,
+)
+from api.types.webhooks import WebhookAspectType
+from api.modules.routemap_buckets import (
+    as_utc,
+    build_bucket_filter,
+    full_month_range,
+    get_bucket_weights,
+    has_routemap_buckets,
+    merge_into_buckets,
+    merge_pending_activities,
+    rebuild_activity_buckets,
+)
+from api.utils.content_types import (
+    NDJSON_MEDIA_TYPE,
+    NEGOTIATED_HEADERS,
+    ROUTEMAP_BINARY_MEDIA_TYPE,
+)
 from api.utils.db import DbCollection
-from api.utils.routemap import generate_routemap
+from api.utils.routemap import (
+    ROUTEMAP_PRECISION,
+    CellStream,
+    RoutemapBuilder,
+    bounds_to_polygon,
+    cells_field,
+    cells_in_area,
+    cells_in_bounds,
+    cells_to_binary,
+    cells_to_routemap_json,
+    coarsen_cells,
+    compute_activity_cells,
+    compute_route_bounds,
+    decode_cells,
+    encode_route,
+    get_route_simplify_tolerance,
+    get_tile_cells_precision,
+    get_tile_precision,
+    simplify_route,
+    tile_bounds,
+    unpack_cells,
+    use_binary_route_storage,
+)
 from api.utils.logger import get_logger
-from api.utils.strava_api import StravaApi
+from api.utils.strava_api import StravaApi, get_list_page_window
+from api.utils.strava_client import StravaHttpClient
+from api.utils.strava_token import decrypt_strava_token, encrypt_strava_token
+from api.utils.strava_webhook import webhooks_enabled
+from api.utils.routemap_cache import CachedRoutemap, RoutemapCache, routemap_cache_key
+from api.utils.sync_pipeline import SyncPipeline
+from api.utils.sync_progress import SyncProgressTracker, SyncWatermark
+
+SYNCED_ACTIVITY_TYPES = ["Walk", "Run", "Ride"]
+
+
+def routemap_projection(precision: int = ROUTEMAP_PRECISION) -> dict[str, Any]:
+    """
+    Only the fields needed to build the routemap are read from the activities.
+    The raw route is only read for activities without precomputed cells of the precision.
+    """
+    has_cells = {"$ifNull": [f"$cells.{cells_field(precision)}", False]}
+    return {
+        "_id": 0,
+        f"cells.{cells_field(precision)}": 1,
+        "route": {"$cond": [has_cells, "$$REMOVE", "$route"]},
+        "route_encoded": {"$cond": [has_cells, "$$REMOVE", "$route_encoded"]},
+        "type": 1,
+        "strava_id": 1,
+    }
+
+
+ROUTEMAP_PROJECTION = routemap_projection()
+ROUTES_CURSOR_BATCH_SIZE = 50
+# Points per line of a cached routemap streamed as NDJSON
+ROUTES_STREAM_BATCH_POINTS = 50_000
+# Routemap builds in progress by cache key and cache generation
+ROUTEMAP_BUILDS: dict[tuple[str, int], asyncio.Task] = {}
+
+
+def get_sync_concurrency() -> int:
+    """
+    Maximum number of activity streams fetched from Strava in parallel during a sync.
+    """
+    concurrency = int(os.getenv("STRAVA_SYNC_CONCURRENCY", "5"))
+    if concurrency < 1:
+        raise ValueError("STRAVA_SYNC_CONCURRENCY must be at least 1.")
+    return concurrency
+
+
+def get_sync_cursor_overlap() -> timedelta:
+    """
+    How far before the sync cursor an incremental sync starts listing activities,
+    to catch activities uploaded late with an earlier start time.
+    """
+    hours = float(os.getenv("SYNC_CURSOR_OVERLAP_HOURS", "72"))
+    if hours < 0:
+        raise ValueError("SYNC_CURSOR_OVERLAP_HOURS must not be negative.")
+    return timedelta(hours=hours)
+
+
+def get_sync_queue_size() -> int:
+    """
+    Maximum number of items waiting between two stages of the sync pipeline.
+    """
+    queue_size = int(os.getenv("SYNC_QUEUE_SIZE", "100"))
+    if queue_size < 1:
+        raise ValueError("SYNC_QUEUE_SIZE must be at least 1.")
+    return queue_size
+
+
+def get_sync_write_batch_size() -> int:
+    """
+    Number of synced activities written to the database in one bulk write.
+    """
+    batch_size = int(os.getenv("SYNC_WRITE_BATCH_SIZE", "50"))
+    if batch_size < 1:
+        raise ValueError("SYNC_WRITE_BATCH_SIZE must be at least 1.")
+    return batch_size
+
+
+def get_latlng_data(stream_response: Any) -> list | None:
+    """
+    The lat/lng points of an activity streams response, None if the activity has no route.
+    """
+    if (
+        not stream_response
+        or "latlng" not in stream_response
+        or not stream_response["latlng"]["data"]
+    ):
+        return None
+    return stream_response["latlng"]["data"]
+
+
+def build_activity_document(
+    user_id: str,
+    activity: dict,
+    latlng_data: list,
+    simplify_tolerance: float,
+    binary_route_storage: bool,
+) -> dict:
+    """
+    The stored activity built from its Strava summary and lat/lng stream, with its grid cells and bounds.
+    """
+    activity_with_route = {
+        "id": str(uuid.uuid4()),
+        "strava_id": activity["id"],
+        "user_id": user_id,
+        "name": activity.get("name", "Unnamed Activity"),
+        "start_date": datetime.fromisoformat(
+            activity["start_date"].replace("Z", "+00:00")
+        ),
+        "distance": activity["distance"],
+        "type": activity["type"],
+        "cells": compute_activity_cells(latlng_data),
+        "bounds": compute_route_bounds(latlng_data),
+    }
+    # The cells and bounds keep every point, only the stored route is simplified
+    stored_route = (
+        simplify_route(latlng_data, simplify_tolerance).tolist()
+        if simplify_tolerance > 0
+        else latlng_data
+    )
+    if binary_route_storage:
+        activity_with_route["route_encoded"] = encode_route(stored_route)
+    else:
+        activity_with_route["route"] = stored_route
+    return activity_with_route
 
 
 async def sync_routes(
-    db: AsyncDatabase, user: User, after: datetime | None, before: datetime | None
+    db: AsyncDatabase,
+    strava_client: StravaHttpClient,
+    user: User,
+    after: datetime | None,
+    before: datetime | None,
+    concurrency: int | None = None,
+    progress: SyncProgressTracker | None = None,
+    routemap_cache: RoutemapCache | None = None,
 ) -> SyncResponse:
     logger = get_logger()
-    strava = StravaApi(user.strava_token)
+    if concurrency is None:
+        concurrency = get_sync_concurrency()
+    if progress is None:
+        progress = SyncProgressTracker()
+    strava = StravaApi(user.strava_token, strava_client)
     activities_collection = db.get_collection(DbCollection.ACTIVITIES)
     sync_meta_collection = db.get_collection(DbCollection.SYNC_METADATA)
 
@@ -24,116 +206,273 @@ async def sync_routes(
         logger.info(
             f"No sync metadata found for user {user.username}, creating new entry."
         )
-        user_sync_data = {"user_id": user.id, "synced_ids": [], "last_synced": None}
+        existing_count = await activities_collection.count_documents(
+            {"user_id": user.id}
+        )
+        # Monthly buckets are complete from the start if there are no activities yet,
+        # otherwise they have to be built with the `build-buckets` command first.
+        user_sync_data = {
+            "user_id": user.id,
+            "last_synced": None,
+            "sync_cursor": None,
+            "routemap_buckets": existing_count == 0,
+        }
         await sync_meta_collection.insert_one(user_sync_data)
 
     logger.info(f"Syncing routes for user: {user.username} ({user.id})")
+    # Activities are marked until merged into the buckets, so a merge cut off by an error or
+    # a restart is finished by the next sync
+    bucket_marker = (
+        {"bucketed": False} if user_sync_data.get("routemap_buckets") else {}
+    )
+    if bucket_marker and await merge_pending_activities(db, user.id):
+        if routemap_cache is not None:
+            await routemap_cache.invalidate_user(user.id)
     just_synced_count = 0
+    batch_size = get_sync_write_batch_size()
+    binary_route_storage = use_binary_route_storage()
+    simplify_tolerance = get_route_simplify_tolerance()
+    pending_activities: list[dict] = []
+    watermark = SyncWatermark()
+    # Syncing an explicit date range leaves the cursor of the incremental syncs alone
+    advance_cursor = before is None or after is None
+
+    async def save_sync_cursor():
+        """
+        Move the sync cursor up to the start time of the newest activity up to which every listed one is done.
+        """
+        cursor = watermark.advance()
+        if not advance_cursor or cursor is None:
+            return
+        await sync_meta_collection.update_one(
+            {"user_id": user.id},
+            {"$max": {"sync_cursor": cursor.isoformat()}},
+        )
+
+    async def write_pending_activities():
+        """
+        Write the buffered activities with one unordered bulk upsert, keyed on (user_id, strava_id),
+        and update the sync metadata once per batch.
+        """
+        nonlocal just_synced_count
+        if not pending_activities:
+            return
+
+        batch = pending_activities.copy()
+        pending_activities.clear()
+        result = await activities_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"user_id": user.id, "strava_id": activity["strava_id"]},
+                    {"$setOnInsert": {**activity, **bucket_marker}},
+                    upsert=True,
+                )
+                for activity in batch
+            ],
+            ordered=False,
+        )
+
+        if result.upserted_count and user_sync_data.get("routemap_buckets"):
+            await merge_into_buckets(
+                db, user.id, [batch[index] for index in result.upserted_ids]
+            )
+
+        await sync_meta_collection.update_one(
+            {"user_id": user.id},
+            {"$max": {"last_synced": datetime.now(timezone.utc).isoformat()}},
+        )
+        for activity in batch:
+            watermark.done(activity["strava_id"])
+        await save_sync_cursor()
+        just_synced_count += result.upserted_count
+        progress.activity_inserted(result.upserted_count)
+        if result.upserted_count and routemap_cache is not None:
+            await routemap_cache.invalidate_user(user.id)
+        logger.info(
+            f"Wrote {len(batch)} activities for user {user.username} ({result.upserted_count} new)."
+        )
+        await progress.flush()
+
     try:
         athlete = await strava.get_athlete()
         logger.info(
             f"Authenticated as athlete: {athlete['username']} ({athlete['id']})"
         )
+        # The webhook finds the user of an event by the athlete and ingests it with the latest token
+        athlete_data: dict[str, Any] = {"athlete_id": athlete["id"]}
+        if webhooks_enabled():
+            athlete_data["strava_token_encrypted"] = encrypt_strava_token(
+                user.strava_token
+            )
+        await sync_meta_collection.update_one(
+            {"user_id": user.id}, {"$set": athlete_data}
+        )
+        await apply_missed_events(db, strava_client, user, progress, routemap_cache)
 
+        list_params: dict[str, int] = {}
         if before is not None and after is not None:
-            before_ts = int(before.timestamp())
-            after_ts = int(after.timestamp())
+            # Job dates read back from MongoDB are naive UTC
+            list_params["before"] = int(as_utc(before).timestamp())
+            list_params["after"] = int(as_utc(after).timestamp())
             logger.info(
-                f"Fetching activities between {after} and {before} (timestamps: {after_ts}, {before_ts})"
-            )
-            activities = await strava.get_all_activities(
-                after=after_ts, before=before_ts
+                f"Fetching activities between {after} and {before} (timestamps: {list_params['after']}, {list_params['before']})"
             )
-        elif user_sync_data["last_synced"] is not None:
-            dt = datetime.fromisoformat(
-                user_sync_data["last_synced"].replace("Z", "+00:00")
-            )
-            epoch_ts = int(dt.timestamp())
-            activities = await strava.get_all_activities(after=epoch_ts)
         else:
-            logger.info("No last synced time found, fetching all activities.")
-            activities = await strava.get_all_activities()
-
-        logger.info(f"Fetched {len(activities)} activities for athlete {athlete['id']}")
-
-        if not activities:
-            logger.info("No activities found to sync.")
-            saved_count = await activities_collection.count_documents(
-                {"user_id": user.id}
-            )
-            return SyncResponse(
-                routes_synced=0,
-                total_routes=saved_count,
-            )
-
-        already_synced = set(user_sync_data["synced_ids"])
+            # With `after` Strava lists the oldest activities first, so the cursor can follow the sync
+            # and a failed sync resumes from the last activity it finished.
+            # Metadata written before the cursor existed falls back to the last sync time.
+            cursor = user_sync_data.get("sync_cursor") or user_sync_data["last_synced"]
+            if cursor is None:
+                logger.info("No sync cursor found, fetching all activities.")
+                list_params["after"] = 0
+            else:
+                dt = datetime.fromisoformat(cursor.replace("Z", "+00:00"))
+                # Activities already stored from the overlap are skipped by the existence check
+                list_params["after"] = max(
+                    0, int((dt - get_sync_cursor_overlap()).timestamp())
+                )
+                logger.info(
+                    f"Fetching activities after the sync cursor {cursor} (timestamp: {list_params['after']})"
+                )
 
-        for activity in activities:
-            strava_id = activity["id"]
+        listed_count = 0
 
-            if strava_id in already_synced:
-                logger.info(f"Activity {strava_id} already synced, skipping.")
-                continue
+        async def select_new_activities(activities: list[dict]) -> list[dict]:
+            """
+            Filter a page of listed activities to the synced types that are not stored yet.
+            """
+            nonlocal listed_count
+            listed_count += len(activities)
+            candidates = []
+            for activity in activities:
+                watermark.listed(
+                    activity["id"],
+                    datetime.fromisoformat(
+                        activity["start_date"].replace("Z", "+00:00")
+                    ),
+                )
+                if activity["type"] not in SYNCED_ACTIVITY_TYPES:
+                    logger.info(
+                        f"Activity {activity['id']} is of type {activity['type']}, skipping."
+                    )
+                    progress.activity_skipped()
+                    watermark.done(activity["id"])
+                    continue
+                candidates.append(activity)
 
-            if activity["type"] not in ["Walk", "Run", "Ride"]:
-                logger.info(
-                    f"Activity {strava_id} is of type {activity['type']}, skipping."
+            # Index-backed existence check on the unique (user_id, strava_id) index
+            already_synced = set(
+                await activities_collection.distinct(
+                    "strava_id",
+                    {
+                        "user_id": user.id,
+                        "strava_id": {
+                            "$in": [activity["id"] for activity in candidates]
+                        },
+                    },
                 )
-                continue
+            )
+            new_activities = []
+            for activity in candidates:
+                if activity["id"] in already_synced:
+                    logger.info(f"Activity {activity['id']} already synced, skipping.")
+                    progress.activity_skipped()
+                    watermark.done(activity["id"])
+                    continue
+                new_activities.append(activity)
+            return new_activities
 
+        async def fetch_stream(activity: dict) -> list[tuple[dict, Any]]:
             stream_response = await strava.get_activity_latlng_stream(
-                activity_id=strava_id
+                activity_id=activity["id"]
             )
+            progress.stream_fetched()
+            return [(activity, stream_response)]
 
-            if (
-                not stream_response
-                or "latlng" not in stream_response
-                or not stream_response["latlng"]["data"]
-            ):
+        async def transform_stream(item: tuple[dict, Any]) -> list[dict]:
+            activity, stream_response = item
+            latlng_data = get_latlng_data(stream_response)
+            if latlng_data is None:
                 logger.info(
-                    f"No lat/lng stream found for activity {strava_id}, skipping."
+                    f"No lat/lng stream found for activity {activity['id']}, skipping."
                 )
-                continue
+                progress.activity_skipped()
+                watermark.done(activity["id"])
+                return []
 
-            latlng_data = stream_response["latlng"]["data"]
             logger.info(
-                f"Activity {strava_id} has lat/lng data with length: {len(latlng_data)}, syncing..."
+                f"Activity {activity['id']} has lat/lng data with length: {len(latlng_data)}, syncing..."
             )
+            # Parsing and quantising runs in a thread, so the event loop keeps serving the other stages
+            return [
+                await asyncio.to_thread(
+                    build_activity_document,
+                    user.id,
+                    activity,
+                    latlng_data,
+                    simplify_tolerance,
+                    binary_route_storage,
+                )
+            ]
 
-            activity_with_route = {
-                "id": str(uuid.uuid4()),
-                "strava_id": strava_id,
-                "user_id": user.id,
-                "name": activity.get("name", "Unnamed Activity"),
-                "start_date": datetime.fromisoformat(
-                    activity["start_date"].replace("Z", "+00:00")
-                ),
-                "distance": activity["distance"],
-                "type": activity["type"],
-                "route": latlng_data,
-            }
-            await activities_collection.insert_one(activity_with_route)
+        async def write_activity(activity: dict) -> list:
+            pending_activities.append(activity)
+            if len(pending_activities) >= batch_size:
+                await write_pending_activities()
+            return []
 
-            user_sync_data["synced_ids"].append(strava_id)
-            user_sync_data["last_synced"] = datetime.now(timezone.utc).isoformat()
-            await sync_meta_collection.update_one(
-                {"user_id": user.id},
-                {"$set": user_sync_data},
-            )
-            just_synced_count += 1
-            logger.info(f"Synced activity {strava_id} for user {user.username}")
+        async def finish_writes() -> list:
+            await write_pending_activities()
+            return []
+
+        # Listing, stream fetches, route processing and writes overlap, connected by bounded queues
+        pipeline = SyncPipeline(get_sync_queue_size())
+
+        async def report_stages(stages: dict[str, SyncStageStats]):
+            progress.stages_updated(stages)
+            logger.info(f"Sync stages for user {user.username}: {pipeline.describe()}")
+            await progress.flush()
 
+        pipeline.source(
+            "list",
+            strava.iter_activity_pages(**list_params, on_page=progress.page_fetched),
+        )
+        pipeline.stage(
+            "select", select_new_activities, queue_size=get_list_page_window()
+        )
+        pipeline.stage("fetch", fetch_stream, workers=concurrency)
+        pipeline.stage("transform", transform_stream)
+        pipeline.stage("write", write_activity, finish=finish_writes)
+        await pipeline.run(on_stats=report_stages)
+        await save_sync_cursor()
+
+        logger.info(
+            f"Fetched {listed_count} activities for athlete {athlete['id']}"
+            if listed_count
+            else "No activities found to sync."
+        )
         logger.info(
             f"Successfully synced {just_synced_count} activities for user {user.username}"
             if just_synced_count > 0
             else "No new activities were synced."
         )
+        logger.info(
+            f"Sync made {strava.metrics.requests} Strava requests over {strava.metrics.connections_opened} new connections."
+        )
+        total_routes = await activities_collection.count_documents({"user_id": user.id})
         return SyncResponse(
             routes_synced=just_synced_count,
-            total_routes=len(user_sync_data["synced_ids"]),
+            total_routes=total_routes,
         )
 
     except Exception as e:
+        progress.error()
+        try:
+            # Keep the activities that were already fetched, so a retry does not fetch them again.
+            await write_pending_activities()
+            await save_sync_cursor()
+        except Exception as write_error:
+            logger.error(f"Could not write fetched activities: {str(write_error)}")
         logger.info(
             f"Synced {just_synced_count} activities for {user.username} before the error."
         )
@@ -144,24 +483,228 @@ async def sync_routes(
         )
 
 
-async def get_routes(
+async def ingest_activity(
     db: AsyncDatabase,
+    strava_client: StravaHttpClient,
     user: User,
-    before: datetime | None,
-    after: datetime | None,
-    types: list[ActivityType] | None = None,
-) -> RoutesResponse:
+    activity_id: int,
+    aspect_type: WebhookAspectType,
+    progress: SyncProgressTracker | None = None,
+    routemap_cache: RoutemapCache | None = None,
+) -> SyncResponse:
+    """
+    Apply one activity event of the Strava webhook, see `apply_activity_event`.
+    When Strava rejects the stored token, which expires a few hours after the sync that stored it,
+    the token is dropped and the event is kept for the next sync of the user to apply.
+    """
+    logger = get_logger()
+    try:
+        return await apply_activity_event(
+            db,
+            strava_client,
+            user,
+            activity_id,
+            aspect_type,
+            progress,
+            routemap_cache,
+        )
+    except HTTPException as e:
+        if e.status_code != status.HTTP_401_UNAUTHORIZED:
+            raise
+
+    sync_meta_collection = db.get_collection(DbCollection.SYNC_METADATA)
+    sync_data = await sync_meta_collection.find_one(
+        {"user_id": user.id}, {"strava_token_encrypted": 1}
+    )
+    stored_token = (sync_data or {}).get("strava_token_encrypted")
+    # A newer sync may have stored a valid token in the meantime
+    if decrypt_strava_token(stored_token) == user.strava_token:
+        await sync_meta_collection.update_one(
+            {"user_id": user.id, "strava_token_encrypted": stored_token},
+            {"$unset": {"strava_token_encrypted": ""}},
+        )
+    await record_missed_event(db, user.id, activity_id, aspect_type)
+    logger.info(
+        f"Strava token of user {user.username} expired, the {aspect_type.value} event of activity {activity_id} is applied by the next sync."
+    )
+    total_routes = await db.get_collection(DbCollection.ACTIVITIES).count_documents(
+        {"user_id": user.id}
+    )
+    return SyncResponse(routes_synced=0, total_routes=total_routes)
+
+
+async def record_missed_event(
+    db: AsyncDatabase,
+    user_id: str,
+    activity_id: int,
+    aspect_type: WebhookAspectType,
+):
+    """
+    Keep a webhook event that could not be applied without a valid Strava token, for the next sync.
+    """
+    await db.get_collection(DbCollection.SYNC_METADATA).update_one(
+        {"user_id": user_id},
+        {
+            "$addToSet": {
+                "missed_events": {
+                    "activity_id": activity_id,
+                    "aspect_type": aspect_type.value,
+                }
+            }
+        },
+    )
+
+
+async def apply_missed_events(
+    db: AsyncDatabase,
+    strava_client: StravaHttpClient,
+    user: User,
+    progress: SyncProgressTracker,
+    routemap_cache: RoutemapCache | None = None,
+):
+    """
+    Apply the webhook events kept by `record_missed_event` with the token of a sync.
+    Listing the activities would find new ones, but not the deleted ones or changed types.
+    """
     logger = get_logger()
+    sync_meta_collection = db.get_collection(DbCollection.SYNC_METADATA)
+    sync_data = await sync_meta_collection.find_one(
+        {"user_id": user.id}, {"missed_events": 1}
+    )
+    missed_events = (sync_data or {}).get("missed_events") or []
+    for event in missed_events:
+        await apply_activity_event(
+            db,
+            strava_client,
+            user,
+            event["activity_id"],
+            WebhookAspectType(event["aspect_type"]),
+            progress,
+            routemap_cache,
+        )
+        await sync_meta_collection.update_one(
+            {"user_id": user.id}, {"$pull": {"missed_events": event}}
+        )
+    if missed_events:
+        logger.info(
+            f"Applied {len(missed_events)} missed webhook events for user {user.username}."
+        )
+
+
+async def apply_activity_event(
+    db: AsyncDatabase,
+    strava_client: StravaHttpClient,
+    user: User,
+    activity_id: int,
+    aspect_type: WebhookAspectType,
+    progress: SyncProgressTracker | None = None,
+    routemap_cache: RoutemapCache | None = None,
+) -> SyncResponse:
+    """
+    Apply one activity event of the Strava webhook without listing the activities.
+    Whatever the event, the activity is read from Strava first, and the event only tells what to expect.
+    A new activity is fetched and stored like in `sync_routes`, a stored one gets its summary refreshed,
+    and it is only removed once Strava no longer has it or its type is not synced anymore.
+    The monthly buckets and cached routemaps of the user follow the change.
+    """
+    logger = get_logger()
+    if progress is None:
+        progress = SyncProgressTracker()
     activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    activity_filter = {"user_id": user.id, "strava_id": activity_id}
+    stored = await activities_collection.find_one(
+        activity_filter, {"_id": 0, "type": 1, "start_date": 1}
+    )
+    changed_buckets: list[dict] = []
+    synced_count = 0
 
+    strava = StravaApi(user.strava_token, strava_client)
+    activity = await strava.get_activity(activity_id)
+    if aspect_type == WebhookAspectType.DELETE and activity is not None:
+        logger.info(f"Activity {activity_id} still exists on Strava, not removing it.")
+
+    if activity is None or activity["type"] not in SYNCED_ACTIVITY_TYPES:
+        if stored is None:
+            logger.info(f"Activity {activity_id} is not stored, skipping.")
+            progress.activity_skipped()
+        else:
+            await activities_collection.delete_one(activity_filter)
+            changed_buckets.append(stored)
+            logger.info(f"Removed activity {activity_id} of user {user.username}.")
+    elif stored is not None:
+        summary = {
+            "name": activity.get("name", "Unnamed Activity"),
+            "distance": activity["distance"],
+            "type": activity["type"],
+        }
+        await activities_collection.update_one(activity_filter, {"$set": summary})
+        if stored["type"] != activity["type"]:
+            changed_buckets.extend([stored, {**stored, "type": activity["type"]}])
+        logger.info(f"Updated activity {activity_id} of user {user.username}.")
+    else:
+        stream_response = await strava.get_activity_latlng_stream(
+            activity_id=activity_id
+        )
+        progress.stream_fetched()
+        latlng_data = get_latlng_data(stream_response)
+        if latlng_data is None:
+            logger.info(
+                f"No lat/lng stream found for activity {activity_id}, skipping."
+            )
+            progress.activity_skipped()
+        else:
+            activity_with_route = await asyncio.to_thread(
+                build_activity_document,
+                user.id,
+                activity,
+                latlng_data,
+                get_route_simplify_tolerance(),
+                use_binary_route_storage(),
+            )
+            buckets = await has_routemap_buckets(db, user.id)
+            # Marked until merged into the buckets, see `merge_pending_activities`
+            bucket_marker = {"bucketed": False} if buckets else {}
+            result = await activities_collection.update_one(
+                activity_filter,
+                {"$setOnInsert": {**activity_with_route, **bucket_marker}},
+                upsert=True,
+            )
+            if result.upserted_id is not None:
+                synced_count = 1
+                progress.activity_inserted()
+                if buckets:
+                    await merge_into_buckets(db, user.id, [activity_with_route])
+                logger.info(f"Stored activity {activity_id} of user {user.username}.")
+
+    if changed_buckets and await has_routemap_buckets(db, user.id):
+        await rebuild_activity_buckets(db, user.id, changed_buckets)
+    if (stored is not None or synced_count) and routemap_cache is not None:
+        await routemap_cache.invalidate_user(user.id)
+
+    total_routes = await activities_collection.count_documents({"user_id": user.id})
+    return SyncResponse(routes_synced=synced_count, total_routes=total_routes)
+
+
+def activity_type_values(types: list[ActivityType] | None = None) -> list[str]:
     if not types:
         types = [ActivityType.WALK, ActivityType.RUN, ActivityType.RIDE]
+    return [t.value if hasattr(t, "value") else t for t in types]
 
-    filter_query: dict[str, Any] = {"user_id": user.id}
 
-    filter_query["type"] = {
-        "$in": [t.value if hasattr(t, "value") else t for t in types]
-    }
+def build_routes_filter(
+    user_id: str,
+    before: datetime | None,
+    after: datetime | None,
+    types: list[ActivityType] | None = None,
+    area: RouteArea | None = None,
+) -> dict[str, Any]:
+    """
+    Build the activities filter of `get_routes`, backed by the (user_id, type, start_date) index,
+    or the (user_id, bounds) geospatial index when filtering by area.
+    """
+    filter_query: dict[str, Any] = {"user_id": user_id}
+
+    filter_query["type"] = {"$in": activity_type_values(types)}
 
     date_filter = {}
     if after:
@@ -171,31 +714,476 @@ async def get_routes(
     if date_filter:
         filter_query["start_date"] = date_filter
 
-    logger.info(
-        f"Fetching routes for user: {user.username} ({user.id}) with filters {str(filter_query)}"
+    area_polygon = bounds_to_polygon(area.bounds) if area else None
+    if area_polygon:
+        filter_query["$or"] = [
+            {"bounds": {"$geoIntersects": {"$geometry": area_polygon}}},
+            # Routes too wide for a bounds polygon, their cells are still filtered by the area
+            {"bounds": {"$type": "null"}},
+        ]
+
+    return filter_query
+
+
+async def get_cached_routemap(
+    db: AsyncDatabase,
+    user: User,
+    before: datetime | None,
+    after: datetime | None,
+    types: list[ActivityType] | None = None,
+    routemap_cache: RoutemapCache | None = None,
+    area: RouteArea | None = None,
+) -> CachedRoutemap:
+    """
+    Get the cells of a routemap query from the cache, or build and cache them.
+    """
+    logger = get_logger()
+    cache_key = routemap_cache_key(user.id, types, after, before, area)
+
+    cached = await routemap_cache.get(cache_key) if routemap_cache else None
+    if cached is not None:
+        logger.info(f"Serving routemap for user {user.username} from cache.")
+        return cached
+
+    return await build_routemap_once(
+        user,
+        cache_key,
+        lambda: build_cached_routemap(db, user, before, after, types, area),
+        routemap_cache,
     )
-    routes = await activities_collection.find(filter_query).to_list()
 
-    if not routes:
+
+async def build_routemap_once(
+    user: User,
+    cache_key: str,
+    build_routemap: Callable[[], Awaitable[CachedRoutemap]],
+    routemap_cache: RoutemapCache | None = None,
+) -> CachedRoutemap:
+    """
+    Build and cache a routemap missing from the cache, sharing the build between concurrent requests.
+    """
+    logger = get_logger()
+    generation = await routemap_cache.generation(user.id) if routemap_cache else 0
+    # Concurrent requests for the same routemap, e.g. every tile of the viewport, share one build
+    build_key = (cache_key, generation)
+    build = ROUTEMAP_BUILDS.get(build_key)
+    if build is None:
+
+        async def build_and_cache() -> CachedRoutemap:
+            cached = await build_routemap()
+            if routemap_cache is not None:
+                await routemap_cache.set(cache_key, user.id, cached, generation)
+            return cached
+
+        build = asyncio.create_task(build_and_cache())
+        ROUTEMAP_BUILDS[build_key] = build
+        build.add_done_callback(lambda _: ROUTEMAP_BUILDS.pop(build_key, None))
+    else:
+        logger.info(f"Waiting for the routemap of user {user.username} being built.")
+    # A request going away does not cancel the build the other requests wait for
+    return await asyncio.shield(build)
+
+
+async def get_routes(
+    db: AsyncDatabase,
+    user: User,
+    before: datetime | None,
+    after: datetime | None,
+    types: list[ActivityType] | None = None,
+    routemap_cache: RoutemapCache | None = None,
+    weighted: bool = False,
+    min_weight: int = 1,
+    area: RouteArea | None = None,
+    binary: bool = False,
+    stream: bool = False,
+) -> Response:
+    """
+    Get the routemap of a query as a `RoutesResponse` JSON, with `binary` as packed fixed-point points,
+    or with `stream` as NDJSON point batches sent while the routemap is built.
+    """
+    if stream:
+        if weighted or min_weight > 1:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Visit counts are only known once the whole routemap is built, 'weighted' and 'minWeight' cannot be streamed.",
+            )
+        return StreamingResponse(
+            stream_routes(db, user, before, after, types, routemap_cache, area),
+            media_type=NDJSON_MEDIA_TYPE,
+            # The GZip middleware would hold the batches back until its buffer fills
+            headers={**NEGOTIATED_HEADERS, "Content-Encoding": "identity"},
+        )
+
+    logger = get_logger()
+    cached = await get_cached_routemap(
+        db, user, before, after, types, routemap_cache, area
+    )
+    if not cached.activity_count:
         logger.info(f"No routes found for user {user.username}")
-        return RoutesResponse(
-            routemap=None,
-            after=after.isoformat() if after else None,
-            before=before.isoformat() if before else None,
-            types=[],
-            activity_count=0,
+
+    if binary:
+        return routemap_binary_response(cached, weighted, min_weight)
+
+    return routemap_json_response(cached, weighted, min_weight, after, before)
+
+
+async def get_routemap_tile(
+    db: AsyncDatabase,
+    user: User,
+    z: int,
+    x: int,
+    y: int,
+    before: datetime | None,
+    after: datetime | None,
+    types: list[ActivityType] | None = None,
+    routemap_cache: RoutemapCache | None = None,
+    weighted: bool = False,
+    min_weight: int = 1,
+    binary: bool = False,
+) -> Response:
+    """
+    Get the routemap points inside a Web Mercator tile, at a precision suited to its zoom level,
+    as a `RoutemapTileResponse` JSON or, with `binary`, as packed fixed-point points.
+    A tile is cut from the cached routemap of the whole query when there is one. Otherwise only the
+    activities whose bounds intersect the tile are read, from the precomputed cells of the coarsest
+    stored level fine enough for the zoom, and the tile is cached on its own.
+    """
+    if not (0 <= x < 2**z and 0 <= y < 2**z):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Tile coordinates must be between 0 and {2**z - 1} at zoom level {z}.",
         )
 
+    logger = get_logger()
+    precision = get_tile_precision(z)
+    cache_key = routemap_cache_key(user.id, types, after, before)
+    cached = await routemap_cache.get(cache_key) if routemap_cache else None
+    if cached is not None:
+        cells, weights = cells_in_bounds(
+            cached.cells, cached.weights, tile_bounds(z, x, y)
+        )
+        cells, weights = coarsen_cells(cells, weights, precision)
+        tile = CachedRoutemap(cells, weights, cached.types, cached.activity_count)
+    else:
+        tile_key = f"{cache_key}|tile|{z}/{x}/{y}"
+        tile = await routemap_cache.get(tile_key) if routemap_cache else None
+        if tile is None:
+            tile = await build_routemap_once(
+                user,
+                tile_key,
+                lambda: build_routemap_tile(db, user, z, x, y, before, after, types),
+                routemap_cache,
+            )
+        else:
+            logger.info(f"Serving routemap tile for user {user.username} from cache.")
+
+    if binary:
+        return routemap_binary_response(tile, weighted, min_weight, precision)
+
+    return routemap_json_response(
+        tile,
+        weighted,
+        min_weight,
+        after,
+        before,
+        precision,
+        {"z": z, "x": x, "y": y, "precision": precision},
+    )
+
+
+def routemap_json_response(
+    routemap: CachedRoutemap,
+    weighted: bool,
+    min_weight: int,
+    after: datetime | None,
+    before: datetime | None,
+    precision: int = ROUTEMAP_PRECISION,
+    tile_fields: dict[str, Any] | None = None,
+) -> Response:
+    """
+    JSON routemap response with the fields of `RoutesResponse`, or `RoutemapTileResponse` with `tile_fields`.
+    The content is serialised directly with orjson, skipping the validation of the response model.
+    """
+    content = {
+        **(tile_fields or {}),
+        "routemap": (
+            cells_to_routemap_json(
+                routemap.cells,
+                routemap.weights,
+                weighted=weighted,
+                min_weight=min_weight,
+                precision=precision,
+            )
+            if routemap.activity_count
+            else None
+        ),
+        "after": after.isoformat() if after else None,
+        "before": before.isoformat() if before else None,
+        "types": routemap.types if routemap.activity_count else [],
+        "activityCount": routemap.activity_count,
+    }
+    return Response(
+        content=orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type="application/json",
+        headers=NEGOTIATED_HEADERS,
+    )
+
+
+def routemap_binary_response(
+    routemap: CachedRoutemap,
+    weighted: bool,
+    min_weight: int,
+    precision: int = ROUTEMAP_PRECISION,
+) -> Response:
+    """
+    Binary routemap response: the points encoded by `cells_to_binary` in the body,
+    and the rest of the routemap in `X-Routemap-*` headers.
+    """
+    body, count, max_weight = cells_to_binary(
+        routemap.cells,
+        routemap.weights,
+        weighted=weighted,
+        min_weight=min_weight,
+        precision=precision,
+    )
+    headers = {
+        **NEGOTIATED_HEADERS,
+        "X-Routemap-Count": str(count),
+        "X-Routemap-Precision": str(precision),
+        "X-Routemap-Weighted": "true" if max_weight is not None else "false",
+        "X-Routemap-Activity-Count": str(routemap.activity_count),
+        "X-Routemap-Types": ",".join(sorted(routemap.types)),
+    }
+    if max_weight is not None:
+        headers["X-Routemap-Max-Weight"] = str(max_weight)
+    return Response(
+        content=body, media_type=ROUTEMAP_BINARY_MEDIA_TYPE, headers=headers
+    )
+
+
+async def build_routemap_tile(
+    db: AsyncDatabase,
+    user: User,
+    z: int,
+    x: int,
+    y: int,
+    before: datetime | None,
+    after: datetime | None,
+    types: list[ActivityType] | None = None,
+) -> CachedRoutemap:
+    """
+    Build one tile from the activities intersecting it, found with the (user_id, bounds) geospatial index.
+    The activity count and types are those of the activities in the tile.
+    """
+    logger = get_logger()
+    precision = get_tile_precision(z)
+    cells_precision = get_tile_cells_precision(precision)
+    bounds = tile_bounds(z, x, y)
+    filter_query = build_routes_filter(
+        user.id, before, after, types, RouteArea(bounds=bounds)
+    )
+    logger.info(
+        f"Fetching routes of tile {z}/{x}/{y} for user: {user.username} ({user.id}) with filters {str(filter_query)}"
+    )
+    builder = RoutemapBuilder(sampling_rate=1, precision=cells_precision)
+    found_types: set[str] = set()
+    cursor = (
+        db.get_collection(DbCollection.ACTIVITIES)
+        .find(filter_query, routemap_projection(cells_precision))
+        .batch_size(ROUTES_CURSOR_BATCH_SIZE)
+    )
+    async for activity in cursor:
+        found_types.add(activity["type"])
+        builder.add_activity(activity)
+
+    cells, weights = builder.build_cells()
+    cells, weights = cells_in_bounds(cells, weights, bounds, cells_precision)
+    cells, weights = coarsen_cells(cells, weights, precision, cells_precision)
+    return CachedRoutemap(
+        cells=cells,
+        weights=weights,
+        types=list(found_types),
+        activity_count=builder.activity_count,
+    )
+
+
+async def build_cached_routemap(
+    db: AsyncDatabase,
+    user: User,
+    before: datetime | None,
+    after: datetime | None,
+    types: list[ActivityType] | None = None,
+    area: RouteArea | None = None,
+) -> CachedRoutemap:
+    """
+    Build the routemap of a query from the sources of `iter_routemap_cells`.
+    """
+    builder = RoutemapBuilder(sampling_rate=1)
+    found_types: set[str] = set()
+    async for _ in iter_routemap_cells(
+        db, user, before, after, types, area, builder, found_types
+    ):
+        pass
+    return finish_routemap(user, builder, found_types, area)
+
+
+async def iter_routemap_cells(
+    db: AsyncDatabase,
+    user: User,
+    before: datetime | None,
+    after: datetime | None,
+    types: list[ActivityType] | None,
+    area: RouteArea | None,
+    builder: RoutemapBuilder,
+    found_types: set[str],
+) -> AsyncIterator[np.ndarray]:
+    """
+    Add the sources of a routemap query to the builder, yielding the cells of every source as it is added.
+    When the monthly buckets of the user are complete, the buckets of fully covered months are used
+    and only the partial months at the edges of the date range are read from the activities.
+    Area queries read only the activities intersecting the area.
+    """
+    logger = get_logger()
+    month_range = (
+        full_month_range(after, before)
+        if area is None and await has_routemap_buckets(db, user.id)
+        else None
+    )
+    if month_range is None:
+        edge_filters = [build_routes_filter(user.id, before, after, types, area)]
+    else:
+        edge_filters = []
+        range_start, range_end = month_range
+        if (
+            range_start is not None
+            and after is not None
+            and as_utc(after) < range_start
+        ):
+            edge_filter = build_routes_filter(user.id, None, after, types)
+            edge_filter["start_date"]["$lt"] = range_start
+            edge_filters.append(edge_filter)
+        if range_end is not None:
+            edge_filter = build_routes_filter(user.id, before, range_end, types)
+            edge_filters.append(edge_filter)
+
+        bucket_filter = build_bucket_filter(
+            user.id,
+            build_routes_filter(user.id, None, None, types)["type"]["$in"],
+            month_range,
+        )
+        logger.info(
+            f"Fetching routemap buckets for user: {user.username} ({user.id}) with filters {str(bucket_filter)}"
+        )
+        bucket_count = 0
+        async for bucket in db.get_collection(DbCollection.ROUTEMAP_BUCKETS).find(
+            bucket_filter,
+            {"_id": 0, "type": 1, "cells": 1, "weights": 1, "activity_count": 1},
+        ):
+            bucket_count += 1
+            bucket_cells = decode_cells(bucket["cells"])
+            builder.add_cells(
+                bucket_cells,
+                bucket["activity_count"],
+                get_bucket_weights(bucket, len(bucket_cells)),
+            )
+            if bucket["activity_count"]:
+                found_types.add(bucket["type"])
+            yield bucket_cells
+        logger.info(f"Merged {bucket_count} monthly buckets.")
+
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    for filter_query in edge_filters:
+        logger.info(
+            f"Fetching routes for user: {user.username} ({user.id}) with filters {str(filter_query)}"
+        )
+        cursor = activities_collection.find(
+            filter_query, ROUTEMAP_PROJECTION
+        ).batch_size(ROUTES_CURSOR_BATCH_SIZE)
+        async for activity in cursor:
+            found_types.add(activity["type"])
+            yield builder.add_activity(activity)
+
+
+def finish_routemap(
+    user: User,
+    builder: RoutemapBuilder,
+    found_types: set[str],
+    area: RouteArea | None,
+) -> CachedRoutemap:
+    logger = get_logger()
     logger.info(
-        f"Found {len(routes)} routes for user {user.username}, generating routemap."
+        f"Collected {builder.activity_count} routes for user {user.username}, generating routemap."
+    )
+    cells, weights = builder.build_cells()
+    if area is not None:
+        cells, weights = cells_in_area(cells, weights, area)
+    return CachedRoutemap(
+        cells=cells,
+        weights=weights,
+        types=list(found_types),
+        activity_count=builder.activity_count,
+    )
+
+
+async def stream_routes(
+    db: AsyncDatabase,
+    user: User,
+    before: datetime | None,
+    after: datetime | None,
+    types: list[ActivityType] | None = None,
+    routemap_cache: RoutemapCache | None = None,
+    area: RouteArea | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream the routemap of a query as NDJSON: `{"points": [[lat, lng], ...]}` lines with points not sent before,
+    as soon as the buckets and activities they come from are read, then a closing line with
+    the `count`, `after`, `before`, `types` and `activityCount` of the routemap.
+    The complete routemap is cached at the end like a regular request.
+    """
+    logger = get_logger()
+    cache_key = routemap_cache_key(user.id, types, after, before, area)
+
+    cached = await routemap_cache.get(cache_key) if routemap_cache else None
+    if cached is not None:
+        logger.info(f"Streaming routemap for user {user.username} from cache.")
+        for start in range(0, len(cached.cells), ROUTES_STREAM_BATCH_POINTS):
+            yield points_line(cached.cells[start : start + ROUTES_STREAM_BATCH_POINTS])
+    else:
+        generation = await routemap_cache.generation(user.id) if routemap_cache else 0
+        builder = RoutemapBuilder(sampling_rate=1)
+        found_types: set[str] = set()
+        cell_stream = CellStream()
+        async for cells in iter_routemap_cells(
+            db, user, before, after, types, area, builder, found_types
+        ):
+            if area is not None:
+                cells, _ = cells_in_area(cells, np.zeros_like(cells), area)
+            new_cells = cell_stream.add(cells)
+            if new_cells is not None and len(new_cells):
+                yield points_line(new_cells)
+        new_cells = cell_stream.flush()
+        if len(new_cells):
+            yield points_line(new_cells)
+
+        cached = finish_routemap(user, builder, found_types, area)
+        if routemap_cache is not None:
+            await routemap_cache.set(cache_key, user.id, cached, generation)
+
+    yield orjson.dumps(
+        {
+            "count": len(cached.cells),
+            "after": after.isoformat() if after else None,
+            "before": before.isoformat() if before else None,
+            "types": cached.types if cached.activity_count else [],
+            "activityCount": cached.activity_count,
+        },
+        option=orjson.OPT_APPEND_NEWLINE,
     )
 
-    routemap = generate_routemap(routes, sampling_rate=1)
 
-    return RoutesResponse(
-        routemap=routemap,
-        after=after.isoformat() if after else None,
-        before=before.isoformat() if before else None,
-        types=list(set(route["type"] for route in routes)),
-        activity_count=len(routes),
+def points_line(cells: np.ndarray) -> bytes:
+    lat, lng = unpack_cells(cells)
+    return orjson.dumps(
+        {"points": np.column_stack([lat, lng])},
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE,
     )
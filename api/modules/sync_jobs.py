@@ -0,0 +1,394 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from api.types.auth import User
+from api.types.common import AsyncDatabase
+from api.types.routes import SyncJobResponse, SyncJobStatus, SyncProgress
+from api.types.webhooks import WebhookAspectType
+from api.modules.routes import ingest_activity, record_missed_event, sync_routes
+from api.utils.db import DbCollection
+from api.utils.logger import get_logger
+from api.utils.routemap_cache import RoutemapCache
+from api.utils.strava_client import StravaHttpClient
+from api.utils.strava_token import decrypt_strava_token, encrypt_strava_token
+from api.utils.sync_progress import SyncProgressTracker
+
+ACTIVE_JOB_STATUSES = [SyncJobStatus.QUEUED.value, SyncJobStatus.RUNNING.value]
+
+
+def get_sync_job_lease() -> timedelta:
+    """
+    How long a running job stays claimed by its process without a heartbeat before another process takes it over.
+    """
+    return timedelta(seconds=max(5, int(os.getenv("SYNC_JOB_LEASE_SECONDS", "60"))))
+
+
+def to_sync_job_response(job: dict) -> SyncJobResponse:
+    return SyncJobResponse(
+        id=job["id"],
+        status=job["status"],
+        after=job["after"].isoformat() if job.get("after") else None,
+        before=job["before"].isoformat() if job.get("before") else None,
+        created_at=job["created_at"].isoformat(),
+        updated_at=job["updated_at"].isoformat(),
+        progress=SyncProgress(**job.get("progress", {})),
+        result=job.get("result"),
+        error=job.get("error"),
+        activity_id=job.get("activity_id"),
+        aspect_type=job.get("aspect_type"),
+    )
+
+
+class SyncJobManager:
+    """
+    This class runs sync jobs in the background on a small pool of asyncio workers.
+    Jobs are persisted in MongoDB and claimed atomically, so with several API processes every job runs once.
+    A running job holds a lease renewed by a heartbeat. Queued jobs and jobs whose lease expired, e.g. after
+    a crash or restart, are picked up again by the periodic recovery of any process.
+    Already synced activities are skipped by the sync, so a resumed job continues where it stopped.
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        strava_client: StravaHttpClient,
+        routemap_cache: RoutemapCache | None = None,
+    ):
+        self.logger = get_logger()
+        self.db = db
+        self.strava_client = strava_client
+        self.routemap_cache = routemap_cache
+        self.jobs_collection = db.get_collection(DbCollection.SYNC_JOBS)
+        self.queue: asyncio.Queue[str] = asyncio.Queue()
+        # Jobs in the queue, so the recovery does not queue them twice
+        self.queued_ids: set[str] = set()
+        self.workers: list[asyncio.Task] = []
+        # Identifies the leases of this process
+        self.owner = str(uuid.uuid4())
+        self.lease = get_sync_job_lease()
+
+    async def start(self):
+        worker_count = int(os.getenv("SYNC_JOB_WORKERS", "2"))
+        self.workers = [
+            asyncio.create_task(self._worker(index)) for index in range(worker_count)
+        ]
+        await self._recover_jobs()
+        self.workers.append(asyncio.create_task(self._recover_periodically()))
+        self.logger.info(f"Sync job manager started with {worker_count} workers.")
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.logger.info("Sync job manager stopped.")
+
+    async def _recover_jobs(self):
+        """
+        Queue the jobs nobody is working on: queued ones, and running ones whose lease expired.
+        A job queued by several processes is still only run by the one claiming it.
+        """
+        unclaimed_jobs = self.jobs_collection.find(
+            {
+                "$or": [
+                    {"status": SyncJobStatus.QUEUED.value},
+                    {
+                        "status": SyncJobStatus.RUNNING.value,
+                        "lease_until": {"$not": {"$gt": datetime.now(timezone.utc)}},
+                    },
+                ]
+            },
+            {"id": 1},
+        ).sort("created_at", 1)
+        async for job in unclaimed_jobs:
+            if job["id"] not in self.queued_ids:
+                self.logger.info(f"Resuming unclaimed sync job {job['id']}")
+                self._queue_job(job["id"])
+
+    async def _recover_periodically(self):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds())
+            try:
+                await self._recover_jobs()
+            except Exception as e:
+                self.logger.error(f"Could not recover sync jobs: {e}")
+
+    async def enqueue(
+        self, user: User, after: datetime | None, before: datetime | None
+    ) -> dict:
+        """
+        Create a sync job for the user and queue it.
+        If the user already has an unfinished job, that job is returned instead of starting a parallel one.
+        The unique `active_sync` index makes concurrent requests agree on a single job.
+        """
+        while True:
+            active_job = await self.jobs_collection.find_one(
+                {"user_id": user.id, "active_sync": True}
+            )
+            if active_job:
+                self.logger.info(
+                    f"User {user.username} already has an active sync job {active_job['id']}"
+                )
+                return active_job
+
+            try:
+                return await self._insert_job(
+                    user, {"after": after, "before": before, "active_sync": True}
+                )
+            except DuplicateKeyError:
+                # Another request created the job in the meantime
+                continue
+
+    async def enqueue_activity(
+        self, user: User, activity_id: int, aspect_type: WebhookAspectType
+    ) -> dict:
+        """
+        Create a job applying one activity event of the Strava webhook and queue it.
+        A queued job for the same event is returned instead, e.g. when Strava retries a delivery.
+        """
+        queued_job = await self.jobs_collection.find_one(
+            {
+                "user_id": user.id,
+                "status": SyncJobStatus.QUEUED.value,
+                "activity_id": activity_id,
+                "aspect_type": aspect_type.value,
+            }
+        )
+        if queued_job:
+            return queued_job
+
+        return await self._insert_job(
+            user,
+            {
+                "after": None,
+                "before": None,
+                "activity_id": activity_id,
+                "aspect_type": aspect_type.value,
+            },
+        )
+
+    async def _insert_job(self, user: User, fields: dict) -> dict:
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user.id,
+            "status": SyncJobStatus.QUEUED.value,
+            **fields,
+            # The Strava token is kept only until the job finishes, to be able to resume after a restart.
+            "strava_token_encrypted": encrypt_strava_token(user.strava_token),
+            "created_at": now,
+            "updated_at": now,
+            "progress": SyncProgress().model_dump(),
+            "result": None,
+            "error": None,
+        }
+        await self.jobs_collection.insert_one(job)
+        self._queue_job(job["id"])
+        self.logger.info(f"Queued sync job {job['id']} for user {user.username}")
+        return job
+
+    def _queue_job(self, job_id: str):
+        self.queued_ids.add(job_id)
+        self.queue.put_nowait(job_id)
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self.queue.get()
+            self.queued_ids.discard(job_id)
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                self.logger.error(f"Sync worker {index} failed on job {job_id}: {e}")
+                try:
+                    # Otherwise the job stays active and blocks the next syncs of the user
+                    await self._finish_job(job_id, SyncJobStatus.FAILED, error=str(e))
+                except Exception as finish_error:
+                    self.logger.error(
+                        f"Could not mark sync job {job_id} failed: {finish_error}"
+                    )
+            finally:
+                self.queue.task_done()
+
+    async def _claim_job(self, job_id: str) -> dict | None:
+        """
+        Atomically move a queued job, or a running one whose lease expired, to running under a lease of this process.
+        Returns None if the job is finished or another process holds it.
+        """
+        now = datetime.now(timezone.utc)
+        return await self.jobs_collection.find_one_and_update(
+            {
+                "id": job_id,
+                "$or": [
+                    {"status": SyncJobStatus.QUEUED.value},
+                    {
+                        "status": SyncJobStatus.RUNNING.value,
+                        "lease_until": {"$not": {"$gt": now}},
+                    },
+                ],
+            },
+            {
+                "$set": {
+                    "status": SyncJobStatus.RUNNING.value,
+                    "lease_owner": self.owner,
+                    "lease_until": now + self.lease,
+                    "updated_at": now,
+                }
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _heartbeat(self, job_id: str):
+        """
+        Renew the lease of a running job until it is cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                result = await self.jobs_collection.update_one(
+                    {"id": job_id, "lease_owner": self.owner},
+                    {"$set": {"lease_until": datetime.now(timezone.utc) + self.lease}},
+                )
+                if not result.matched_count:
+                    self.logger.warning(f"Lost the lease of sync job {job_id}.")
+            except Exception as e:
+                self.logger.error(
+                    f"Could not renew the lease of sync job {job_id}: {e}"
+                )
+
+    async def _run_job(self, job_id: str):
+        job = await self._claim_job(job_id)
+        if not job:
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await self._run_claimed_job(job)
+        finally:
+            heartbeat.cancel()
+
+    async def _run_claimed_job(self, job: dict):
+        job_id = job["id"]
+
+        user_data = await self.db.get_collection(DbCollection.USERS).find_one(
+            {"id": job["user_id"]}
+        )
+        if not user_data:
+            await self._finish_job(
+                job_id, SyncJobStatus.FAILED, error="User not found."
+            )
+            return
+
+        strava_token = decrypt_strava_token(job.get("strava_token_encrypted"))
+        if not strava_token:
+            if job.get("activity_id") is not None:
+                await record_missed_event(
+                    self.db,
+                    job["user_id"],
+                    job["activity_id"],
+                    WebhookAspectType(job["aspect_type"]),
+                )
+            await self._finish_job(
+                job_id,
+                SyncJobStatus.FAILED,
+                error="The Strava token of the job is not available anymore.",
+            )
+            return
+
+        user = User(**user_data, strava_token=strava_token)
+
+        async def save_progress(progress: SyncProgress):
+            await self._update_job(job_id, {"progress": progress.model_dump()})
+
+        tracker = SyncProgressTracker(
+            progress=SyncProgress(**job.get("progress", {})),
+            on_flush=save_progress,
+        )
+        try:
+            if job.get("activity_id") is not None:
+                result = await ingest_activity(
+                    self.db,
+                    self.strava_client,
+                    user,
+                    job["activity_id"],
+                    WebhookAspectType(job["aspect_type"]),
+                    progress=tracker,
+                    routemap_cache=self.routemap_cache,
+                )
+            else:
+                result = await sync_routes(
+                    self.db,
+                    self.strava_client,
+                    user,
+                    after=job["after"],
+                    before=job["before"],
+                    progress=tracker,
+                    routemap_cache=self.routemap_cache,
+                )
+        except Exception as e:
+            await tracker.flush(force=True)
+            error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+            await self._finish_job(job_id, SyncJobStatus.FAILED, error=error)
+            return
+
+        await tracker.flush(force=True)
+        await self._finish_job(
+            job_id, SyncJobStatus.COMPLETED, result=result.model_dump()
+        )
+
+    async def _update_job(self, job_id: str, fields: dict):
+        await self.jobs_collection.update_one(
+            {"id": job_id},
+            {"$set": {**fields, "updated_at": datetime.now(timezone.utc)}},
+        )
+
+    async def _finish_job(
+        self,
+        job_id: str,
+        job_status: SyncJobStatus,
+        result: dict | None = None,
+        error: str | None = None,
+    ):
+        # A job whose lease was taken over is finished by the new owner
+        await self.jobs_collection.update_one(
+            {"id": job_id, "lease_owner": self.owner},
+            {
+                "$set": {
+                    "status": job_status.value,
+                    "result": result,
+                    "error": error,
+                    "updated_at": datetime.now(timezone.utc),
+                },
+                "$unset": {
+                    "strava_token_encrypted": "",
+                    "active_sync": "",
+                    "lease_owner": "",
+                    "lease_until": "",
+                },
+            },
+        )
+        self.logger.info(f"Sync job {job_id} finished with status {job_status.value}")
+
+
+async def start_sync_job(
+    job_manager: SyncJobManager,
+    user: User,
+    after: datetime | None,
+    before: datetime | None,
+) -> SyncJobResponse:
+    job = await job_manager.enqueue(user, after, before)
+    return to_sync_job_response(job)
+
+
+async def get_sync_job(db: AsyncDatabase, user: User, job_id: str) -> SyncJobResponse:
+    job = await db.get_collection(DbCollection.SYNC_JOBS).find_one(
+        {"id": job_id, "user_id": user.id}
+    )
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sync job not found.",
+        )
+    return to_sync_job_response(job)
@@ -0,0 +1,119 @@
+import hmac
+from fastapi import HTTPException, status
+from api.types.auth import User
+from api.types.common import AsyncDatabase
+from api.types.webhooks import (
+    StravaWebhookEvent,
+    WebhookChallengeResponse,
+    WebhookEventResponse,
+    WebhookObjectType,
+)
+from api.modules.routes import record_missed_event
+from api.modules.sync_jobs import SyncJobManager
+from api.utils.db import DbCollection
+from api.utils.logger import get_logger
+from api.utils.strava_token import decrypt_strava_token
+from api.utils.strava_webhook import (
+    get_webhook_path_secret,
+    get_webhook_subscription_id,
+    get_webhook_verify_token,
+)
+
+
+def check_webhook_path(path_secret: str):
+    """
+    Answer 404 unless the webhook has a verify token and is called on the secret callback path,
+    so the webhook can not be found, let alone called, without the secret.
+    The subscription id is only checked for events, Strava returns it after the validation.
+    """
+    expected_secret = get_webhook_path_secret()
+    if (
+        get_webhook_verify_token() is None
+        or expected_secret is None
+        or not hmac.compare_digest(path_secret, expected_secret)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Strava webhook is not enabled.",
+        )
+
+
+def verify_webhook_subscription(
+    path_secret: str, mode: str, verify_token: str, challenge: str
+) -> WebhookChallengeResponse:
+    """
+    Answer the validation request Strava sends when the webhook subscription is created.
+    """
+    check_webhook_path(path_secret)
+    expected_token = get_webhook_verify_token() or ""
+    if mode != "subscribe" or not hmac.compare_digest(verify_token, expected_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid verify token.",
+        )
+    return WebhookChallengeResponse(hub_challenge=challenge)
+
+
+async def handle_webhook_event(
+    db: AsyncDatabase,
+    job_manager: SyncJobManager,
+    path_secret: str,
+    event: StravaWebhookEvent,
+) -> WebhookEventResponse:
+    """
+    Queue a single activity job for every user synced from the athlete of an activity event.
+    The users are found by the athlete id and encrypted Strava token stored by their latest sync.
+    The jobs read the activity from Strava instead of trusting the event, so an event can not
+    remove an activity that Strava still has. A deauthorization of the athlete drops the stored token,
+    and the events of users without a token are kept for their next sync.
+    """
+    logger = get_logger()
+    check_webhook_path(path_secret)
+    subscription_id = get_webhook_subscription_id()
+    if subscription_id is None or event.subscription_id != subscription_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Unknown webhook subscription.",
+        )
+
+    sync_meta_collection = db.get_collection(DbCollection.SYNC_METADATA)
+    athlete_filter = {"athlete_id": event.owner_id}
+
+    if event.object_type == WebhookObjectType.ATHLETE:
+        if str(event.updates.get("authorized")).lower() == "false":
+            await sync_meta_collection.update_many(
+                athlete_filter, {"$unset": {"strava_token_encrypted": ""}}
+            )
+            logger.info(f"Athlete {event.owner_id} deauthorized the app.")
+        return WebhookEventResponse(job_ids=[])
+
+    users_collection = db.get_collection(DbCollection.USERS)
+    job_ids = []
+    async for sync_data in sync_meta_collection.find(
+        athlete_filter, {"user_id": 1, "strava_token_encrypted": 1}
+    ):
+        strava_token = decrypt_strava_token(sync_data.get("strava_token_encrypted"))
+        # Every event is checked with Strava, deletions included
+        if not strava_token:
+            await record_missed_event(
+                db, sync_data["user_id"], event.object_id, event.aspect_type
+            )
+            logger.info(
+                f"No Strava token stored for user {sync_data['user_id']}, the event of activity {event.object_id} is applied by the next sync."
+            )
+            continue
+        user_data = await users_collection.find_one({"id": sync_data["user_id"]})
+        if not user_data:
+            continue
+
+        user = User(**user_data, strava_token=strava_token)
+        job = await job_manager.enqueue_activity(
+            user, event.object_id, event.aspect_type
+        )
+        job_ids.append(job["id"])
+
+    if not job_ids:
+        logger.info(
+            f"No user to apply the {event.aspect_type.value} event of activity {event.object_id} to."
+        )
+    return WebhookEventResponse(job_ids=job_ids)
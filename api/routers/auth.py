@@ -25,4 +25,4 @@ router = APIRouter(
 async def post_register_user(
     body: RegistrationRequest, req: Request
 ) -> RegistrationResponse:
-    return await register_user(req.app.state.db, body)
+    return await register_user(req.app.state.db, body, req.app.state.auth_cache)
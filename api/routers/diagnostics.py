@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Request
+
+from api.types.diagnostics import MetricsResponse
+
+router = APIRouter(
+    prefix="/diagnostics",
+    tags=["diagnostics"],
+)
+
+
+@router.get(
+    "/metrics",
+    summary="Get runtime metrics of the API process",
+    description="This endpoint returns in-process counters, e.g. how many Strava requests reused a pooled connection or how often the routemap and authenticated user caches were hit.",
+)
+async def get_metrics(req: Request) -> MetricsResponse:
+    routemap_cache = req.app.state.routemap_cache
+    auth_cache = req.app.state.auth_cache
+    return MetricsResponse(
+        strava_http=req.app.state.strava_client.metrics.to_response(),
+        strava_rate_limit=req.app.state.strava_client.rate_limiter.to_response(),
+        routemap_cache=routemap_cache.metrics() if routemap_cache else None,
+        auth_cache=auth_cache.metrics() if auth_cache else None,
+    )
@@ -1,12 +1,25 @@
 from datetime import datetime
 from typing import Annotated
-from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi import APIRouter, Depends, Path, Query, Request, Response, status
 
-from api.modules.routes import get_routes, sync_routes
+from api.modules.routes import get_routemap_tile, get_routes
+from api.modules.sync_jobs import get_sync_job, start_sync_job
 from api.types.auth import User
-from api.types.routes import ActivityType, RoutesResponse, SyncResponse
+from api.types.routes import (
+    ActivityType,
+    RouteArea,
+    RoutemapTileResponse,
+    RoutesResponse,
+    SyncJobResponse,
+)
+from api.utils.routemap import MAX_TILE_ZOOM
 from api.utils.auth import auth_user
-from api.utils.query_validators import validate_before_after
+from api.utils.content_types import (
+    NDJSON_MEDIA_TYPE,
+    ROUTEMAP_BINARY_MEDIA_TYPE,
+    accepts,
+)
+from api.utils.query_validators import validate_area, validate_before_after
 
 router = APIRouter(
     prefix="/routes",
@@ -16,9 +29,19 @@ router = APIRouter(
 
 @router.get(
     "",
+    response_model=RoutesResponse,
     summary="Get routes map coordinates for the authenticated user",
-    description="This endpoint retrieves the routes map coordinates for the authenticated user. You can filter the results by date range and activity type.",
+    description="This endpoint retrieves the routes map coordinates for the authenticated user. You can filter the results by date range, activity type and area, either a bounding box or a radius around a point. With an area filter only the activities crossing the area are read, and only the coordinates inside it are returned. Send 'Accept: application/octet-stream' to get the coordinates as packed little-endian int32 (latitude, longitude) pairs, or (latitude, longitude, weight) triples in weighted mode, in fixed-point with 'X-Routemap-Precision' decimal places. The other fields of the routemap are returned in 'X-Routemap-*' headers. Send 'Accept: application/x-ndjson' to stream the coordinates while the routemap is built, as '{\"points\": [...]}' lines of coordinates not sent before, followed by a line with the 'count', 'after', 'before', 'types' and 'activityCount' of the routemap; 'weighted' and 'minWeight' are not supported when streaming.",
     responses={
+        200: {
+            "description": "Successful Response",
+            "content": {
+                ROUTEMAP_BINARY_MEDIA_TYPE: {
+                    "schema": {"type": "string", "format": "binary"},
+                },
+                NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}},
+            },
+        },
         401: {
             "description": "Unauthorized",
             "content": {
@@ -48,17 +71,119 @@ async def get_get_routes(
             description="Filter activities by type ('Walk', 'Run', 'Ride'). If not provided, all types are included.",
         ),
     ] = None,
-) -> RoutesResponse:
+    weighted: Annotated[
+        bool,
+        Query(
+            description="Return 'weightedPoints' as (latitude, longitude, weight) instead of 'points', where the weight is the number of distinct activities passing the point.",
+        ),
+    ] = False,
+    min_weight: Annotated[
+        int,
+        Query(
+            alias="minWeight",
+            ge=1,
+            description="Drop points passed by fewer distinct activities than this.",
+        ),
+    ] = 1,
+    area: Annotated[RouteArea | None, Depends(validate_area)] = None,
+) -> Response:
     return await get_routes(
-        db=req.app.state.db, user=user, before=before, after=after, types=types
+        db=req.app.state.db,
+        user=user,
+        before=before,
+        after=after,
+        types=types,
+        routemap_cache=req.app.state.routemap_cache,
+        weighted=weighted,
+        min_weight=min_weight,
+        area=area,
+        binary=accepts(req, ROUTEMAP_BINARY_MEDIA_TYPE),
+        stream=accepts(req, NDJSON_MEDIA_TYPE),
+    )
+
+
+@router.get(
+    "/tiles/{z}/{x}/{y}",
+    response_model=RoutemapTileResponse,
+    summary="Get the routes map coordinates of a map tile for the authenticated user",
+    description="This endpoint retrieves the routes map coordinates inside a Web Mercator (slippy map) tile for the authenticated user. The coordinates are rounded to fewer decimal places at low zoom levels, see 'precision' in the response. Filters are the same as for 'GET /routes'. Tiles are cut from the cached routemap of the same filters when there is one, otherwise only the activities crossing the tile are read and the tile is cached on its own. Like 'GET /routes', the tile can be requested in the binary format with 'Accept: application/octet-stream'.",
+    responses={
+        200: {
+            "description": "Successful Response",
+            "content": {
+                ROUTEMAP_BINARY_MEDIA_TYPE: {
+                    "schema": {"type": "string", "format": "binary"},
+                },
+            },
+        },
+        401: {
+            "description": "Unauthorized",
+            "content": {
+                "application/json": {"example": {"detail": "Invalid API key."}}
+            },
+        },
+    },
+)
+async def get_get_routemap_tile(
+    req: Request,
+    user: Annotated[User, Depends(auth_user)],
+    z: Annotated[int, Path(ge=0, le=MAX_TILE_ZOOM, description="Zoom level")],
+    x: Annotated[int, Path(ge=0, description="Tile column")],
+    y: Annotated[int, Path(ge=0, description="Tile row")],
+    after: Annotated[
+        datetime | None,
+        Query(
+            description="Filter activities after this date - ISO 8601 format, e.g., '2023-10-01T00:00:00Z'",
+        ),
+    ] = None,
+    before: Annotated[
+        datetime | None,
+        Query(
+            description="Filter activities before this date - ISO 8601 format, e.g., '2023-10-01T00:00:00Z'",
+        ),
+    ] = None,
+    types: Annotated[
+        list[ActivityType] | None,
+        Query(
+            description="Filter activities by type ('Walk', 'Run', 'Ride'). If not provided, all types are included.",
+        ),
+    ] = None,
+    weighted: Annotated[
+        bool,
+        Query(
+            description="Return 'weightedPoints' as (latitude, longitude, weight) instead of 'points', where the weight is the number of distinct activities passing the point.",
+        ),
+    ] = False,
+    min_weight: Annotated[
+        int,
+        Query(
+            alias="minWeight",
+            ge=1,
+            description="Drop points passed by fewer distinct activities than this.",
+        ),
+    ] = 1,
+) -> Response:
+    return await get_routemap_tile(
+        db=req.app.state.db,
+        user=user,
+        z=z,
+        x=x,
+        y=y,
+        before=before,
+        after=after,
+        types=types,
+        routemap_cache=req.app.state.routemap_cache,
+        weighted=weighted,
+        min_weight=min_weight,
+        binary=accepts(req, ROUTEMAP_BINARY_MEDIA_TYPE),
     )
 
 
 @router.post(
     "/sync",
-    summary="Trigger a sync of activities from Strava",
-    description="This endpoint triggers a synchronization of activities from Strava for the authenticated user. By default it will sync all activities after the last synced time. You can specify 'before' and 'after' parameters to filter activities within a specific date range. NOTE! There is a rate limit on the Strava API so for the initial sync it is recommended to use the 'before' and 'after' parameters to limit the number of activities fetched to be around 50 and wait 15 minutes between the attempts.",
-    status_code=status.HTTP_201_CREATED,
+    summary="Start a background sync of activities from Strava",
+    description="This endpoint starts a background synchronization of activities from Strava for the authenticated user and returns the sync job immediately. Use the 'GET /routes/sync/{job_id}' endpoint to follow its progress. By default it will sync all activities starting shortly before the newest activity synced so far, so an interrupted sync continues where it stopped and activities uploaded late are still found. You can specify 'before' and 'after' parameters to filter activities within a specific date range. If the user already has an unfinished sync job, that job is returned instead. NOTE! The Strava API is rate limited. When the limit is reached the sync pauses until the limit window resets and then continues automatically, so a large initial sync can take a long time.",
+    status_code=status.HTTP_202_ACCEPTED,
     responses={
         401: {
             "description": "Unauthorized",
@@ -72,5 +197,32 @@ async def post_sync_routes(
     req: Request,
     user: Annotated[User, Depends(auth_user)],
     params: Annotated[dict[str, datetime | None], Depends(validate_before_after)],
-) -> SyncResponse:
-    return await sync_routes(req.app.state.db, user, **params)
+) -> SyncJobResponse:
+    return await start_sync_job(req.app.state.sync_job_manager, user, **params)
+
+
+@router.get(
+    "/sync/{job_id}",
+    summary="Get the status and progress of a sync job",
+    description="This endpoint returns the status of a sync job of the authenticated user, with the number of activity pages and streams fetched, activities inserted and skipped, and errors so far.",
+    responses={
+        401: {
+            "description": "Unauthorized",
+            "content": {
+                "application/json": {"example": {"detail": "Invalid API key."}}
+            },
+        },
+        404: {
+            "description": "Sync job not found",
+            "content": {
+                "application/json": {"example": {"detail": "Sync job not found."}}
+            },
+        },
+    },
+)
+async def get_sync_job_status(
+    req: Request,
+    user: Annotated[User, Depends(auth_user)],
+    job_id: str,
+) -> SyncJobResponse:
+    return await get_sync_job(req.app.state.db, user, job_id)
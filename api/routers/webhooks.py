@@ -0,0 +1,76 @@
+from typing import Annotated
+from fastapi import APIRouter, Query, Request
+
+from api.modules.webhooks import handle_webhook_event, verify_webhook_subscription
+from api.types.webhooks import (
+    StravaWebhookEvent,
+    WebhookChallengeResponse,
+    WebhookEventResponse,
+)
+
+router = APIRouter(
+    prefix="/strava/webhook",
+    tags=["webhooks"],
+)
+
+
+@router.get(
+    "/{path_secret}",
+    response_model=WebhookChallengeResponse,
+    summary="Validate the Strava webhook subscription",
+    description="Strava calls this endpoint when the webhook subscription is created. The callback URL ends with STRAVA_WEBHOOK_PATH_SECRET, and the challenge is echoed back if 'hub.verify_token' matches STRAVA_WEBHOOK_VERIFY_TOKEN.",
+    responses={
+        403: {
+            "description": "Invalid verify token",
+            "content": {
+                "application/json": {"example": {"detail": "Invalid verify token."}}
+            },
+        },
+        404: {
+            "description": "Webhook not enabled",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Strava webhook is not enabled."}
+                }
+            },
+        },
+    },
+)
+async def get_webhook_challenge(
+    path_secret: str,
+    mode: Annotated[str, Query(alias="hub.mode")],
+    verify_token: Annotated[str, Query(alias="hub.verify_token")],
+    challenge: Annotated[str, Query(alias="hub.challenge")],
+) -> WebhookChallengeResponse:
+    return verify_webhook_subscription(path_secret, mode, verify_token, challenge)
+
+
+@router.post(
+    "/{path_secret}",
+    summary="Receive a Strava webhook event",
+    description="Strava posts activity and athlete events to this endpoint. Only events of STRAVA_WEBHOOK_SUBSCRIPTION_ID posted to the secret callback URL are accepted. Created, updated and deleted activities are applied one by one in background sync jobs of the users synced from the athlete, without listing their activities. The jobs read every activity from Strava, and only remove it once Strava no longer has it or its type is not synced. A deauthorization drops the Strava token stored for the webhook.",
+    responses={
+        403: {
+            "description": "Unknown webhook subscription",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Unknown webhook subscription."}
+                }
+            },
+        },
+        404: {
+            "description": "Webhook not enabled",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Strava webhook is not enabled."}
+                }
+            },
+        },
+    },
+)
+async def post_webhook_event(
+    req: Request, path_secret: str, event: StravaWebhookEvent
+) -> WebhookEventResponse:
+    return await handle_webhook_event(
+        req.app.state.db, req.app.state.sync_job_manager, path_secret, event
+    )
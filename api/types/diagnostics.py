@@ -0,0 +1,53 @@
+from api.types.common import PkBaseModel
+
+
+class StravaHttpMetricsResponse(PkBaseModel):
+    requests: int
+    connections_opened: int
+    tls_handshakes: int
+    connection_reuse_ratio: float
+
+
+class RateLimitWindowResponse(PkBaseModel):
+    limit: int
+    usage: int
+    resets_at: str  # ISO 8601 format
+
+
+class StravaRateLimitResponse(PkBaseModel):
+    short_window: RateLimitWindowResponse
+    daily_window: RateLimitWindowResponse
+    paused_until: str | None = None  # ISO 8601 format
+    pause_count: int
+    paused_seconds: float
+
+
+class QueryPlanReport(PkBaseModel):
+    name: str
+    collection: str
+    filter: str
+    indexes: list[str]
+    stages: list[str]
+    collection_scan: bool
+    covered: bool
+    keys_examined: int
+    docs_examined: int
+    returned: int
+
+
+class CacheMetricsResponse(PkBaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    expirations: int
+    invalidations: int
+    entries: int
+    size: int
+
+
+class MetricsResponse(PkBaseModel):
+    strava_http: StravaHttpMetricsResponse
+    strava_rate_limit: StravaRateLimitResponse
+    routemap_cache: CacheMetricsResponse | None = None
+    auth_cache: CacheMetricsResponse | None = None
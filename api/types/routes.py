@@ -1,5 +1,6 @@
 from enum import Enum
 from api.types.common import PkBaseModel
+from api.types.webhooks import WebhookAspectType
 
 
 class ActivityType(str, Enum):
@@ -13,12 +14,61 @@ class SyncResponse(PkBaseModel):
     total_routes: int
 
 
+class SyncJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class SyncStageStats(PkBaseModel):
+    workers: int
+    processed: int  # items handled by the stage
+    per_second: float  # items handled per second since the stage started
+    busy_seconds: float  # time spent handling items, summed over the workers
+    queue_depth: int  # items waiting for the stage
+    max_queue_depth: int
+
+
+class SyncProgress(PkBaseModel):
+    pages_fetched: int = 0
+    streams_fetched: int = 0
+    inserted: int = 0
+    skipped: int = 0
+    errors: int = 0
+    stages: dict[str, SyncStageStats] = {}
+
+
+class SyncJobResponse(PkBaseModel):
+    id: str
+    status: SyncJobStatus
+    after: str | None = None  # ISO 8601 format
+    before: str | None = None  # ISO 8601 format
+    created_at: str  # ISO 8601 format
+    updated_at: str  # ISO 8601 format
+    progress: SyncProgress
+    result: SyncResponse | None = None
+    error: str | None = None
+    activity_id: int | None = None  # set for single activity jobs of the Strava webhook
+    aspect_type: WebhookAspectType | None = None
+
+
 Coords = tuple[float, float]  # (latitude, longitude)
+WeightedCoords = tuple[float, float, int]  # (latitude, longitude, activity count)
+Bounds = tuple[float, float, float, float]  # (south, west, north, east)
+
+
+class RouteArea(PkBaseModel):
+    bounds: Bounds
+    center: Coords | None = None  # Only with a radius filter
+    radius: float | None = None  # Radius around the center in meters
 
 
 class Routemap(PkBaseModel):
     count: int = 0
     points: set[Coords] = set()
+    weighted_points: list[WeightedCoords] | None = None  # Only in weighted mode
+    max_weight: int | None = None  # Only in weighted mode
 
 
 class RoutesResponse(PkBaseModel):
@@ -29,6 +79,18 @@ class RoutesResponse(PkBaseModel):
     activity_count: int
 
 
+class RoutemapTileResponse(PkBaseModel):
+    z: int
+    x: int
+    y: int
+    precision: int  # Decimal places of the tile points
+    routemap: Routemap | None = None
+    after: str | None = None
+    before: str | None = None
+    types: list[ActivityType]
+    activity_count: int
+
+
 class RouteResource:
     id: str
     strava_id: int
@@ -37,4 +99,5 @@ class RouteResource:
     start_date: str  # ISO 8601 format
     distance: float  # Distance in meters
     type: ActivityType
-    route: list[list[float]]  # List of (latitude, longitude) tuples as arrays
+    route: list[list[float]] | None  # List of (latitude, longitude) tuples as arrays
+    route_encoded: bytes | None  # Delta encoded int32 fixed-point (lat, lng) pairs
@@ -0,0 +1,33 @@
+from enum import Enum
+from typing import Any
+from pydantic import Field
+from api.types.common import PkBaseModel
+
+
+class WebhookObjectType(str, Enum):
+    ACTIVITY = "activity"
+    ATHLETE = "athlete"
+
+
+class WebhookAspectType(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+class StravaWebhookEvent(PkBaseModel):
+    object_type: WebhookObjectType
+    object_id: int  # activity or athlete id
+    aspect_type: WebhookAspectType
+    owner_id: int  # athlete id
+    subscription_id: int
+    event_time: int  # Unix timestamp
+    updates: dict[str, Any] = Field(default_factory=dict)
+
+
+class WebhookEventResponse(PkBaseModel):
+    job_ids: list[str]  # sync jobs queued for the event
+
+
+class WebhookChallengeResponse(PkBaseModel):
+    hub_challenge: str = Field(..., serialization_alias="hub.challenge")
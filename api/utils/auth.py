@@ -8,6 +8,7 @@ from fastapi.security import APIKeyHeader
 
 from api.types.auth import User
 from api.types.common import AsyncDatabase
+from api.utils.auth_cache import AuthCache
 from api.utils.db import DbCollection
 from api.utils.logger import get_logger
 
@@ -42,9 +43,14 @@ async def auth_user(
             detail="Internal server error: Could not handle the API Key.",
         )
 
-    user = await db.get_collection(DbCollection.USERS).find_one(
-        {"api_key_hash": api_key_hash}
-    )
+    auth_cache: AuthCache | None = request.app.state.auth_cache
+    cached, user = auth_cache.get(api_key_hash) if auth_cache else (False, None)
+    if not cached:
+        user = await db.get_collection(DbCollection.USERS).find_one(
+            {"api_key_hash": api_key_hash}
+        )
+        if auth_cache:
+            auth_cache.set(api_key_hash, user)
     if not user:
         logger.warning(f"Unauthorized access attempt with API key: {api_key}")
         raise HTTPException(
@@ -68,10 +74,22 @@ def hash_api_key(api_key: str) -> str:
     Hash the API key using SHA-256 with a secret salt.
     """
 
-    salt = os.getenv("API_SECRET")
-    if not salt:
-        raise ValueError("API_SECRET environment variable is not set.")
-
     hash_obj = hashlib.sha256()
-    hash_obj.update((api_key + salt).encode("utf-8"))
+    hash_obj.update((api_key + get_api_secret()).encode("utf-8"))
     return hash_obj.hexdigest()
+
+
+_api_secret: str | None = None
+
+
+def get_api_secret() -> str:
+    """
+    The secret salt of the API key hashes, read from the `API_SECRET` environment variable once.
+    """
+    global _api_secret
+    if _api_secret is None:
+        salt = os.getenv("API_SECRET")
+        if not salt:
+            raise ValueError("API_SECRET environment variable is not set.")
+        _api_secret = salt
+    return _api_secret
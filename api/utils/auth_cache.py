@@ -0,0 +1,77 @@
+import os
+
+from api.types.diagnostics import CacheMetricsResponse
+from api.utils.cache import CacheStats, TTLCache
+from api.utils.logger import get_logger
+
+
+class AuthCache:
+    """
+    Cache of the user records by API key hash, so authenticated requests skip the database lookup.
+    API keys without a user are cached too, for a shorter time, so repeated requests with invalid keys
+    do not reach the database. They are kept apart from the users, so a flood of invalid keys
+    can not evict the known users.
+    """
+
+    def __init__(
+        self, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float
+    ):
+        self.users: TTLCache[str, dict] = TTLCache(max_entries, ttl_seconds)
+        self.invalid_keys: TTLCache[str, bool] = TTLCache(
+            max_entries, negative_ttl_seconds
+        )
+        self.stats = CacheStats()
+
+    def get(self, api_key_hash: str) -> tuple[bool, dict | None]:
+        """
+        Look up an API key hash: (True, user) for a known user, (True, None) for a known invalid key,
+        and (False, None) when the key has to be looked up in the database.
+        """
+        user = self.users.get(api_key_hash)
+        if user is not None:
+            self.stats.hits += 1
+            return True, user
+        if self.invalid_keys.get(api_key_hash):
+            self.stats.hits += 1
+            return True, None
+        self.stats.misses += 1
+        return False, None
+
+    def set(self, api_key_hash: str, user: dict | None):
+        if user is None:
+            self.invalid_keys.set(api_key_hash, True)
+        else:
+            self.users.set(api_key_hash, user)
+
+    def invalidate(self, api_key_hash: str):
+        self.users.delete(api_key_hash)
+        self.invalid_keys.delete(api_key_hash)
+        self.stats.invalidations += 1
+
+    def metrics(self) -> CacheMetricsResponse:
+        self.stats.evictions = (
+            self.users.stats.evictions + self.invalid_keys.stats.evictions
+        )
+        self.stats.expirations = (
+            self.users.stats.expirations + self.invalid_keys.stats.expirations
+        )
+        entries = len(self.users) + len(self.invalid_keys)
+        return self.stats.to_response(entries, entries)
+
+
+def create_auth_cache() -> AuthCache | None:
+    """
+    Create the authenticated user cache configured with `AUTH_CACHE_TTL`, disabled when it is 0.
+    """
+    logger = get_logger()
+    ttl_seconds = float(os.getenv("AUTH_CACHE_TTL", "300"))
+    if ttl_seconds <= 0:
+        logger.info("Authenticated user cache is disabled.")
+        return None
+
+    negative_ttl_seconds = float(os.getenv("AUTH_CACHE_NEGATIVE_TTL", "30"))
+    max_entries = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+    logger.info(
+        f"Using authenticated user cache ({max_entries} entries, TTL {ttl_seconds}s, invalid keys {negative_ttl_seconds}s)."
+    )
+    return AuthCache(max_entries, ttl_seconds, negative_ttl_seconds)
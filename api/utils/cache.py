@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+from api.types.diagnostics import CacheMetricsResponse
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class CacheStats:
+    """
+    Hit, miss and eviction counters of a cache.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def to_response(self, entries: int, size: int) -> CacheMetricsResponse:
+        lookups = self.hits + self.misses
+        return CacheMetricsResponse(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=(self.hits / lookups) if lookups else 0.0,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            invalidations=self.invalidations,
+            entries=entries,
+            size=size,
+        )
+
+
+class TTLCache(Generic[K, V]):
+    """
+    In-process LRU cache with a time-to-live for every entry.
+    The least recently used entries are evicted when either `max_entries` or `max_size` is exceeded,
+    where the size of an entry is given by `size_of` (1 per entry by default).
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        max_size: int | None = None,
+        size_of: Callable[[V], int] | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.size_of = size_of or (lambda value: 1)
+        self.size = 0
+        self.stats = CacheStats()
+        self._entries: OrderedDict[K, tuple[float, int, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: K, value: V):
+        if key in self._entries:
+            self._remove(key)
+
+        size = self.size_of(value)
+        if self.max_size is not None and size > self.max_size:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+        self.size += size
+
+        while len(self._entries) > self.max_entries or (
+            self.max_size is not None and self.size > self.max_size
+        ):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.stats.evictions += 1
+
+    def delete(self, key: K):
+        if key in self._entries:
+            self._remove(key)
+            self.stats.invalidations += 1
+
+    def delete_where(self, predicate: Callable[[K], bool]):
+        for key in [key for key in self._entries if predicate(key)]:
+            self.delete(key)
+
+    def clear(self):
+        self.stats.invalidations += len(self._entries)
+        self._entries.clear()
+        self.size = 0
+
+    def _remove(self, key: K):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
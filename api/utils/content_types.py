@@ -0,0 +1,19 @@
+from fastapi import Request
+
+# Routemap points as packed little-endian int32 fixed-point values, see `cells_to_binary`
+ROUTEMAP_BINARY_MEDIA_TYPE = "application/octet-stream"
+# Routemap points streamed as newline delimited JSON, see `stream_routes`
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Headers of responses whose format is chosen by `accepts`, so shared caches keep the formats apart
+NEGOTIATED_HEADERS = {"Vary": "Accept"}
+
+
+def accepts(request: Request, media_type: str) -> bool:
+    """
+    Whether the Accept header of the request explicitly lists the media type.
+    Wildcards are ignored, so clients get JSON unless they ask for something else.
+    """
+    accept = request.headers.get("accept", "")
+    return any(
+        value.split(";")[0].strip().lower() == media_type for value in accept.split(",")
+    )
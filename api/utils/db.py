@@ -1,6 +1,7 @@
 import os
 from enum import Enum
-from pymongo import AsyncMongoClient
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, AsyncMongoClient, IndexModel
+from pymongo.errors import OperationFailure
 from pymongo.server_api import ServerApi
 
 from api.types.common import AsyncDatabase
@@ -11,6 +12,64 @@ class DbCollection(str, Enum):
     USERS = "users"
     ACTIVITIES = "activities"
     SYNC_METADATA = "sync_metadata"
+    SYNC_JOBS = "sync_jobs"
+    ROUTEMAP_CACHE = "routemap_cache"
+    ROUTEMAP_BUCKETS = "routemap_buckets"
+
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+# Indexes backing the hot queries, created idempotently on startup.
+INDEXES: dict[DbCollection, list[IndexModel]] = {
+    DbCollection.USERS: [
+        IndexModel([("api_key_hash", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    DbCollection.ACTIVITIES: [
+        IndexModel([("user_id", ASCENDING), ("strava_id", ASCENDING)], unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("type", ASCENDING), ("start_date", ASCENDING)]
+        ),
+        IndexModel([("user_id", ASCENDING), ("bounds", GEOSPHERE)]),
+        # Activities stored but not merged into their routemap buckets yet
+        IndexModel(
+            [("user_id", ASCENDING)],
+            name="user_id_bucket_pending",
+            partialFilterExpression={"bucketed": False},
+        ),
+    ],
+    DbCollection.SYNC_METADATA: [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("athlete_id", ASCENDING)]),
+    ],
+    DbCollection.SYNC_JOBS: [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # At most one unfinished full sync per user, enforced atomically on insert
+        IndexModel(
+            [("user_id", ASCENDING)],
+            name="user_id_active_sync",
+            unique=True,
+            partialFilterExpression={"active_sync": True},
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)]
+        ),
+        # Recovery of queued jobs and of running jobs with an expired lease
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)]),
+    ],
+    DbCollection.ROUTEMAP_BUCKETS: [
+        IndexModel(
+            [("user_id", ASCENDING), ("type", ASCENDING), ("month", ASCENDING)],
+            unique=True,
+        ),
+    ],
+    DbCollection.ROUTEMAP_CACHE: [
+        IndexModel([("key", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
 
 
 class MongoDbManager:
@@ -58,3 +117,89 @@ class MongoDbManager:
             raise
 
         self.logger.info(f"Connected to MongoDB database: {mongodb_name}")
+        await self._ensure_indexes()
+        await self._migrate()
+
+    async def _ensure_indexes(self):
+        """
+        Create the indexes in `INDEXES`. Creating an existing index is a no-op, so this runs on every startup.
+        """
+        if self.db is None:
+            return
+
+        for collection_name, indexes in INDEXES.items():
+            collection = self.db.get_collection(collection_name)
+            created = []
+            # One by one, so an index that can not be built does not block the others
+            for index in indexes:
+                try:
+                    created.extend(await collection.create_indexes([index]))
+                except OperationFailure as e:
+                    if (
+                        e.code != DUPLICATE_KEY_ERROR_CODE
+                        or collection_name != DbCollection.ACTIVITIES
+                    ):
+                        self.logger.error(
+                            f"Failed to create index {index.document['name']} on {collection_name.value}: {e}"
+                        )
+                        continue
+                    self.logger.warning(
+                        "Duplicate activities found, removing them before creating the unique index."
+                    )
+                    await self._remove_duplicate_activities()
+                    created.extend(await collection.create_indexes([index]))
+            self.logger.info(
+                f"Ensured indexes on {collection_name.value}: {', '.join(created)}"
+            )
+
+    async def _migrate(self):
+        """
+        Idempotent schema migrations, run on every startup.
+        """
+        if self.db is None:
+            return
+
+        # Synced activities are deduplicated by the unique index, the old id list is not needed anymore.
+        result = await self.db.get_collection(DbCollection.SYNC_METADATA).update_many(
+            {"synced_ids": {"$exists": True}}, {"$unset": {"synced_ids": ""}}
+        )
+        if result.modified_count:
+            self.logger.info(
+                f"Removed synced_ids from {result.modified_count} sync metadata documents."
+            )
+
+        # Strava tokens are stored encrypted, the plaintext ones of older syncs and jobs are dropped.
+        # Webhook events of their users are kept for the next sync, the jobs fail.
+        for collection_name in (DbCollection.SYNC_METADATA, DbCollection.SYNC_JOBS):
+            result = await self.db.get_collection(collection_name).update_many(
+                {"strava_token": {"$exists": True}}, {"$unset": {"strava_token": ""}}
+            )
+            if result.modified_count:
+                self.logger.info(
+                    f"Removed plaintext Strava tokens from {result.modified_count} {collection_name.value} documents."
+                )
+
+    async def _remove_duplicate_activities(self):
+        if self.db is None:
+            return
+
+        activities = self.db.get_collection(DbCollection.ACTIVITIES)
+        duplicates = await activities.aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": {"user_id": "$user_id", "strava_id": "$strava_id"},
+                        "ids": {"$push": "$_id"},
+                        "count": {"$sum": 1},
+                    }
+                },
+                {"$match": {"count": {"$gt": 1}}},
+            ]
+        )
+        removed_count = 0
+        async for duplicate in duplicates:
+            result = await activities.delete_many(
+                {"_id": {"$in": duplicate["ids"][1:]}}
+            )
+            removed_count += result.deleted_count
+        self.logger.info(f"Removed {removed_count} duplicate activities.")
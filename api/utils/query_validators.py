@@ -2,6 +2,9 @@ from datetime import datetime
 from typing import Annotated
 from fastapi import HTTPException, Query, status
 
+from api.types.routes import RouteArea
+from api.utils.routemap import radius_bounds
+
 
 def validate_before_after(
     after: Annotated[
@@ -28,3 +31,71 @@ def validate_before_after(
             detail="Both 'before' and 'after' must be provided together, or neither.",
         )
     return {"before": before, "after": after}
+
+
+def validate_area(
+    bbox: Annotated[
+        str | None,
+        Query(
+            description="Only include routes inside this bounding box - 'west,south,east,north' in degrees, e.g., '18.9,47.4,19.2,47.6'",
+        ),
+    ] = None,
+    lat: Annotated[
+        float | None,
+        Query(
+            ge=-90,
+            le=90,
+            description="Latitude of the center of the radius filter; Requires 'lng' and 'radius' to be set.",
+        ),
+    ] = None,
+    lng: Annotated[
+        float | None,
+        Query(
+            ge=-180,
+            le=180,
+            description="Longitude of the center of the radius filter; Requires 'lat' and 'radius' to be set.",
+        ),
+    ] = None,
+    radius: Annotated[
+        float | None,
+        Query(
+            gt=0,
+            description="Only include routes within this distance in meters around 'lat' and 'lng'.",
+        ),
+    ] = None,
+) -> RouteArea | None:
+    """
+    Parse the geographic filter of the routes: either a bounding box or a radius around a point.
+    Invalid or conflicting parameters raise an HTTP 422 error.
+    """
+    radius_params = [lat, lng, radius]
+    if any(param is not None for param in radius_params):
+        if any(param is None for param in radius_params):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="'lat', 'lng' and 'radius' must be provided together, or neither.",
+            )
+        if bbox is not None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Either 'bbox' or 'lat', 'lng' and 'radius' can be provided, not both.",
+            )
+        return RouteArea(
+            bounds=radius_bounds((lat, lng), radius), center=(lat, lng), radius=radius
+        )
+
+    if bbox is None:
+        return None
+    try:
+        west, south, east, north = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="'bbox' must be four comma separated numbers: 'west,south,east,north'.",
+        )
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="'bbox' must have west < east within [-180, 180] and south < north within [-90, 90].",
+        )
+    return RouteArea(bounds=(south, west, north, east))
@@ -1,50 +1,630 @@
 import math
-from typing import cast
+import os
+from typing import Any
+import numpy as np
+from bson import Binary
 
-from api.types.routes import Coords, Routemap
+from api.types.routes import Bounds, Coords, RouteArea
 from api.utils.logger import get_logger
 
+# Coordinates are rounded to 4 decimal places for better clustering (approx. 11m precision)
+ROUTEMAP_PRECISION = 4
 
-def generate_routemap(activities: list[dict], sampling_rate: int = 5) -> Routemap:
+
+def cell_key_bits(precision: int) -> int:
+    """
+    Number of bits needed for the longitude part of a packed cell key.
     """
-    Generate a route map based on activity data.
-    This function takes a list of activities, extracts route coordinates,
-    and clusters them.
+    return (360 * 10**precision).bit_length()
 
-    ### Adjust this parameters to control clustering sensitivity and performance.
-    - `sampling_rate`: How often to sample points from the route (e.g., every 5th point). Default is 5.
+
+def quantise_route(
+    route: list | np.ndarray, precision: int = ROUTEMAP_PRECISION
+) -> np.ndarray:
+    """
+    Quantise (lat, lng) pairs to integer grid cells and pack every cell into one int64 key.
+    Keys are latitude-major, so sorting them orders the cells by latitude, then longitude.
+    """
+    coords = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    scale = 10**precision
+    lat_cells = np.rint(coords[:, 0] * scale).astype(np.int64) + 90 * scale
+    lng_cells = np.rint(coords[:, 1] * scale).astype(np.int64) + 180 * scale
+    return (lat_cells << cell_key_bits(precision)) | lng_cells
+
+
+def unpack_cells(
+    keys: np.ndarray, precision: int = ROUTEMAP_PRECISION
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert packed cell keys back to latitude and longitude arrays.
+    """
+    scale = 10**precision
+    bits = cell_key_bits(precision)
+    lat = ((keys >> bits) - 90 * scale) / scale
+    lng = ((keys & ((1 << bits) - 1)) - 180 * scale) / scale
+    return lat, lng
+
+
+# Fixed-point scale of binary encoded routes (6 decimal places, approx. 0.1m precision)
+ROUTE_FIXED_POINT_SCALE = 10**6
+
+
+def use_binary_route_storage() -> bool:
+    """
+    Whether new activities store their route as delta encoded binary (`route_encoded`)
+    instead of an array of coordinate pairs (`route`).
+    """
+    return os.getenv("ROUTE_STORAGE_FORMAT", "array") == "binary"
+
+
+def encode_route(route: list | np.ndarray) -> Binary:
+    """
+    Encode (lat, lng) pairs as little-endian int32 fixed-point values.
+    The first pair is absolute, every following pair is the delta to the previous one,
+    which keeps the values small and compresses well on disk.
     """
-    logger = get_logger()
+    coords = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    fixed = np.rint(coords * ROUTE_FIXED_POINT_SCALE).astype(np.int64)
+    deltas = np.diff(fixed, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    return Binary(deltas.astype("<i4").tobytes())
 
-    points: set[Coords] = set()
-    activity_count = len(activities)
 
-    for index, activity in enumerate(activities):
-        route = activity["route"]
-        if not route:
+def decode_route(encoded: bytes) -> np.ndarray:
+    """
+    Decode a binary route straight into an (n, 2) array of (lat, lng) floats.
+    """
+    deltas = np.frombuffer(encoded, dtype="<i4").reshape(-1, 2)
+    return np.cumsum(deltas, axis=0, dtype=np.int64) / ROUTE_FIXED_POINT_SCALE
+
+
+def get_route_coordinates(activity: dict) -> list | np.ndarray:
+    """
+    Get the route of an activity document in either storage format.
+    """
+    if activity.get("route_encoded") is not None:
+        return decode_route(activity["route_encoded"])
+    return activity.get("route") or []
+
+
+def get_route_simplify_tolerance() -> float:
+    """
+    Tolerance in meters of the line simplification of stored routes, 0 keeps every point.
+    """
+    return float(os.getenv("ROUTE_SIMPLIFY_TOLERANCE_M", "0"))
+
+
+def simplify_route(route: list | np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Simplify a route with the Douglas-Peucker algorithm: drop the points closer than `tolerance` meters
+    to the line between the points kept around them, so straight stretches shrink to their ends
+    while corners are kept. The coordinates are projected to meters on a local equirectangular plane,
+    which is accurate enough over the extent of an activity, and the distances of every segment
+    are computed at once with NumPy.
+    """
+    coords = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    if tolerance <= 0 or len(coords) < 3:
+        return coords
+
+    xy = np.radians(coords[:, ::-1]) * EARTH_RADIUS
+    xy[:, 0] *= math.cos(math.radians(float(coords[:, 0].mean())))
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[0] = keep[-1] = True
+    segments = [(0, len(coords) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
             continue
+        offsets = xy[start + 1 : end] - xy[start]
+        direction = xy[end] - xy[start]
+        length2 = float(direction @ direction)
+        if length2 > 0:
+            t = np.clip(offsets @ direction / length2, 0.0, 1.0)
+            offsets = offsets - t[:, None] * direction
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+    return coords[keep]
+
+
+def get_cell_precisions() -> list[int]:
+    """
+    Precisions (decimal places) of the grid cells precomputed for every activity at sync time.
+    The routemap precision is always included, coarser levels can be added for zoomed out views.
+    """
+    configured = os.getenv("ROUTEMAP_CELL_PRECISIONS", str(ROUTEMAP_PRECISION))
+    precisions = {int(value) for value in configured.split(",") if value.strip()}
+    precisions.add(ROUTEMAP_PRECISION)
+    return sorted(precisions, reverse=True)
+
+
+def cells_field(precision: int = ROUTEMAP_PRECISION) -> str:
+    """
+    Key of the precomputed cells of the given precision inside the activity `cells` document.
+    """
+    return f"p{precision}"
+
+
+def compute_route_cells(
+    route: list | np.ndarray, precision: int = ROUTEMAP_PRECISION
+) -> np.ndarray:
+    """
+    Quantise a route and deduplicate its cells. The result is sorted and unique.
+    The first point is skipped, as the routemap has always done.
+    """
+    if not len(route):
+        return np.empty(0, dtype=np.int64)
+    return np.unique(quantise_route(route, precision)[1:])
 
-        logger.info(
-            f"Processing activity {index+1}/{activity_count} {activity['strava_id']} with {len(route)} coordinates."
-        )
 
-        points_before = len(points)
-        for entry in route[1::sampling_rate]:
-            # Round coordinates to 4 decimal places for better clustering (approx. 11m precision)
-            coords: Coords = (
-                round(entry[0], 4),
-                round(entry[1], 4),
+EARTH_RADIUS = 6371000  # meters
+
+# Route bounds are padded, so routes of a single point or a straight line still form a valid polygon
+ROUTE_BOUNDS_PADDING = 1e-5
+
+
+def bounds_to_polygon(bounds: Bounds) -> dict | None:
+    """
+    GeoJSON polygon containing the (south, west, north, east) bounds, for `2dsphere` queries.
+    Polygon edges are great circle arcs, which bend towards the pole between two points of the same latitude,
+    so the latitude edges are moved out by that bend. Bounds of 180 degrees longitude or wider have no
+    unambiguous polygon and return None.
+    """
+    south, west, north, east = (float(value) for value in bounds)
+    half_width = math.radians(east - west) / 2
+    if half_width >= math.pi / 2:
+        return None
+    padding = max(
+        math.degrees(math.atan(math.tan(math.radians(abs(lat))) / math.cos(half_width)))
+        - abs(lat)
+        for lat in (south, north)
+    )
+    south = max(-90.0, south - padding)
+    north = min(90.0, north + padding)
+    return {
+        "type": "Polygon",
+        "coordinates": [
+            [[west, south], [east, south], [east, north], [west, north], [west, south]]
+        ],
+    }
+
+
+def longitude_range(lngs: np.ndarray) -> tuple[float, float]:
+    """
+    Shortest (west, east) longitude range containing all longitudes, i.e. the complement of the widest gap
+    between them. A range crossing the antimeridian has west > east.
+    """
+    lngs = np.unique(lngs)
+    gaps = np.diff(np.append(lngs, lngs[0] + 360))
+    widest = int(np.argmax(gaps))
+    if widest == len(lngs) - 1:
+        return float(lngs[0]), float(lngs[-1])
+    return float(lngs[widest + 1]), float(lngs[widest])
+
+
+def compute_route_bounds(route: list | np.ndarray) -> dict | None:
+    """
+    Precompute the `bounds` polygon of an activity: the bounding box of its route.
+    The box of a route crossing the antimeridian is split there into a MultiPolygon.
+    Routes too wide for a polygon get None, and are read by every area query.
+    """
+    coords = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    if not len(coords):
+        return None
+    south = max(-90.0, coords[:, 0].min() - ROUTE_BOUNDS_PADDING)
+    north = min(90.0, coords[:, 0].max() + ROUTE_BOUNDS_PADDING)
+    west, east = longitude_range(coords[:, 1])
+    if west <= east:
+        return bounds_to_polygon(
+            (
+                south,
+                max(-180.0, west - ROUTE_BOUNDS_PADDING),
+                north,
+                min(180.0, east + ROUTE_BOUNDS_PADDING),
             )
-            points.add(coords)
+        )
+
+    polygons = [
+        bounds_to_polygon((south, west - ROUTE_BOUNDS_PADDING, north, 180.0)),
+        bounds_to_polygon((south, -180.0, north, east + ROUTE_BOUNDS_PADDING)),
+    ]
+    if any(polygon is None for polygon in polygons):
+        return None
+    return {
+        "type": "MultiPolygon",
+        "coordinates": [polygon["coordinates"] for polygon in polygons],
+    }
+
+
+def radius_bounds(center: Coords, radius: float) -> Bounds:
+    """
+    Bounding box of a circle of `radius` meters around the center.
+    """
+    lat, lng = center
+    lat_delta = math.degrees(radius / EARTH_RADIUS)
+    lng_delta = math.degrees(
+        radius / (EARTH_RADIUS * max(math.cos(math.radians(lat)), 1e-6))
+    )
+    return (
+        max(-90.0, lat - lat_delta),
+        max(-180.0, lng - lng_delta),
+        min(90.0, lat + lat_delta),
+        min(180.0, lng + lng_delta),
+    )
+
+
+def encode_cells(cells: np.ndarray) -> Binary:
+    return Binary(cells.astype("<i8").tobytes())
+
+
+def decode_cells(encoded: bytes) -> np.ndarray:
+    return np.frombuffer(encoded, dtype="<i8").astype(np.int64)
+
+
+def encode_weights(weights: np.ndarray) -> Binary:
+    return Binary(weights.astype("<i4").tobytes())
+
 
-        points_after = len(points)
-        logger.info(
-            f"Added {points_after - points_before} unique points from activity."
+def decode_weights(encoded: bytes) -> np.ndarray:
+    return np.frombuffer(encoded, dtype="<i4").astype(np.int64)
+
+
+def merge_weighted_cells(
+    cells: list[np.ndarray], weights: list[np.ndarray]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Union cell arrays and sum the weights of the cells present in several of them.
+    With unique cells per activity, the resulting weight is the number of distinct activities per cell.
+    """
+    if not cells:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    unique_cells, inverse = np.unique(np.concatenate(cells), return_inverse=True)
+    merged_weights = np.bincount(
+        inverse, weights=np.concatenate(weights), minlength=len(unique_cells)
+    ).astype(np.int64)
+    return unique_cells, merged_weights
+
+
+def compute_activity_cells(route: list | np.ndarray) -> dict[str, Binary]:
+    """
+    Precompute the `cells` document of an activity: its unique grid cells at every configured precision.
+    """
+    return {
+        cells_field(precision): encode_cells(compute_route_cells(route, precision))
+        for precision in get_cell_precisions()
+    }
+
+
+def get_activity_cells(
+    activity: dict, precision: int = ROUTEMAP_PRECISION
+) -> np.ndarray | None:
+    """
+    Get the precomputed cells of an activity document, or None if they have not been computed yet.
+    """
+    encoded = (activity.get("cells") or {}).get(cells_field(precision))
+    if encoded is None:
+        return None
+    return decode_cells(encoded)
+
+
+def filter_min_weight(
+    cells: np.ndarray, weights: np.ndarray | None, min_weight: int
+) -> tuple[np.ndarray, np.ndarray | None]:
+    if weights is None or min_weight <= 1:
+        return cells, weights
+    visible = weights >= min_weight
+    return cells[visible], weights[visible]
+
+
+def cells_to_binary(
+    cells: np.ndarray,
+    weights: np.ndarray | None = None,
+    weighted: bool = False,
+    min_weight: int = 1,
+    precision: int = ROUTEMAP_PRECISION,
+) -> tuple[bytes, int, int | None]:
+    """
+    Encode cells as packed little-endian int32 (latitude, longitude) pairs in fixed-point at the given
+    precision, or (latitude, longitude, weight) triples in weighted mode.
+    Returns the encoded points with their count and maximum weight.
+    """
+    cells, weights = filter_min_weight(cells, weights, min_weight)
+    scale = 10**precision
+    bits = cell_key_bits(precision)
+    columns = [
+        (cells >> bits) - 90 * scale,
+        (cells & ((1 << bits) - 1)) - 180 * scale,
+    ]
+    max_weight = None
+    if weighted and weights is not None:
+        columns.append(weights)
+        max_weight = int(weights.max()) if len(weights) else 0
+    points = np.column_stack(columns).astype("<i4")
+    return points.tobytes(), len(cells), max_weight
+
+
+# Precision of routemap tiles by zoom level: tiles up to the given zoom use coarser cells
+TILE_PRECISIONS = ((6, 2), (10, 3))
+MAX_TILE_ZOOM = 22
+
+
+def get_tile_precision(z: int) -> int:
+    for max_zoom, precision in TILE_PRECISIONS:
+        if z <= max_zoom:
+            return precision
+    return ROUTEMAP_PRECISION
+
+
+def get_tile_cells_precision(precision: int) -> int:
+    """
+    Precomputed cells a tile of the given precision is built from: the coarsest stored level that is
+    at least as fine, so zoomed out tiles read the small coarse cells instead of the full precision ones.
+    """
+    return min(stored for stored in get_cell_precisions() if stored >= precision)
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """
+    (south, west, north, east) of a Web Mercator (slippy map) tile.
+    """
+    n = 2**z
+
+    def tile_lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return tile_lat(y + 1), x / n * 360 - 180, tile_lat(y), (x + 1) / n * 360 - 180
+
+
+def cells_in_bounds(
+    cells: np.ndarray,
+    weights: np.ndarray,
+    bounds: tuple[float, float, float, float],
+    precision: int = ROUTEMAP_PRECISION,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Select the cells inside the (south, west, north, east) bounds, south and west inclusive.
+    Cells must be sorted, as returned by `np.unique`: the keys are latitude-major, so the latitude band
+    is found by binary search and only the cells of that band are filtered by longitude.
+    """
+    south, west, north, east = bounds
+    scale = 10**precision
+    bits = cell_key_bits(precision)
+    lat_start = math.ceil(south * scale) + 90 * scale
+    lat_end = math.ceil(north * scale) + 90 * scale
+    start, end = np.searchsorted(cells, [lat_start << bits, lat_end << bits])
+    band_cells = cells[start:end]
+    band_weights = weights[start:end]
+    lng = band_cells & ((1 << bits) - 1)
+    visible = (lng >= math.ceil(west * scale) + 180 * scale) & (
+        lng < math.ceil(east * scale) + 180 * scale
+    )
+    return band_cells[visible], band_weights[visible]
+
+
+def cells_in_area(
+    cells: np.ndarray,
+    weights: np.ndarray,
+    area: RouteArea,
+    precision: int = ROUTEMAP_PRECISION,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Select the cells inside the bounds of the area, and within its radius if it has one.
+    """
+    cells, weights = cells_in_bounds(cells, weights, area.bounds, precision)
+    if area.center is None or area.radius is None:
+        return cells, weights
+
+    lat, lng = unpack_cells(cells, precision)
+    center_lat, center_lng = np.radians(area.center)
+    phi = np.radians(lat)
+    a = (
+        np.sin((phi - center_lat) / 2) ** 2
+        + np.cos(center_lat)
+        * np.cos(phi)
+        * np.sin((np.radians(lng) - center_lng) / 2) ** 2
+    )
+    within = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0))) <= area.radius
+    return cells[within], weights[within]
+
+
+def coarsen_cells(
+    cells: np.ndarray,
+    weights: np.ndarray,
+    precision: int,
+    from_precision: int = ROUTEMAP_PRECISION,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Re-quantise cells to a coarser precision. A coarse cell keeps the highest weight of the cells it covers,
+    which is a lower bound of the distinct activities passing it.
+    """
+    if precision >= from_precision:
+        return cells, weights
+    factor = 10 ** (from_precision - precision)
+    from_scale = 10**from_precision
+    from_bits = cell_key_bits(from_precision)
+    lat = (cells >> from_bits) - 90 * from_scale
+    lng = (cells & ((1 << from_bits) - 1)) - 180 * from_scale
+
+    scale = 10**precision
+    coarse_lat = (lat + factor // 2) // factor + 90 * scale
+    coarse_lng = (lng + factor // 2) // factor + 180 * scale
+    coarse_cells, inverse = np.unique(
+        (coarse_lat << cell_key_bits(precision)) | coarse_lng, return_inverse=True
+    )
+    coarse_weights = np.zeros(len(coarse_cells), dtype=np.int64)
+    np.maximum.at(coarse_weights, inverse, weights)
+    return coarse_cells, coarse_weights
+
+
+def cells_to_routemap_json(
+    cells: np.ndarray,
+    weights: np.ndarray | None = None,
+    weighted: bool = False,
+    min_weight: int = 1,
+    precision: int = ROUTEMAP_PRECISION,
+) -> dict[str, Any]:
+    """
+    The routemap response of cells as a dict by alias, with the points in a NumPy array.
+    Cells visited by fewer than `min_weight` distinct activities are dropped, and in weighted mode
+    every point carries its visit count.
+    It is serialised directly with `orjson.OPT_SERIALIZE_NUMPY`, instead of Pydantic validating
+    and serialising every point tuple.
+    """
+    cells, weights = filter_min_weight(cells, weights, min_weight)
+    lat, lng = unpack_cells(cells, precision)
+    if not weighted or weights is None:
+        return {
+            "count": len(cells),
+            "points": np.column_stack([lat, lng]),
+            "weightedPoints": None,
+            "maxWeight": None,
+        }
+    return {
+        "count": len(cells),
+        "points": [],
+        "weightedPoints": list(zip(lat.tolist(), lng.tolist(), weights.tolist())),
+        "maxWeight": int(weights.max()) if len(weights) else 0,
+    }
+
+
+class CellStream:
+    """
+    Deduplicate cells arriving in batches, so each cell is emitted once.
+    New cells are buffered until at least `min_batch` of them, or an eighth of the already emitted cells,
+    are pending. The first batches go out quickly and the merges with the emitted cells stay amortised linear.
+    """
+
+    def __init__(self, min_batch: int = 10_000):
+        self.min_batch = min_batch
+        self.emitted = np.empty(0, dtype=np.int64)
+        self.pending: list[np.ndarray] = []
+        self.pending_size = 0
+
+    def add(self, cells: np.ndarray) -> np.ndarray | None:
+        """
+        Buffer cells and return the new ones when a batch is due.
+        """
+        self.pending.append(cells)
+        self.pending_size += len(cells)
+        if self.pending_size < max(self.min_batch, len(self.emitted) // 8):
+            return None
+        return self.flush()
+
+    def flush(self) -> np.ndarray:
+        """
+        Return the buffered cells that have not been emitted yet.
+        """
+        if not self.pending:
+            return np.empty(0, dtype=np.int64)
+        new_cells = np.setdiff1d(
+            np.unique(np.concatenate(self.pending)), self.emitted, assume_unique=True
         )
+        self.emitted = np.union1d(self.emitted, new_cells)
+        self.pending = []
+        self.pending_size = 0
+        return new_cells
+
+
+class RoutemapBuilder:
+    """
+    Build a route map incrementally, one activity at a time.
+    Coordinates are quantised to packed int64 grid cells with NumPy and deduplicated with `np.unique`,
+    so activities can be streamed from the database and peak memory scales with the number of
+    unique cells instead of all raw coordinates.
+
+    ### Adjust this parameters to control clustering sensitivity and performance.
+    - `sampling_rate`: How often to sample points from the route (e.g., every 5th point). Default is 5.
+    - `compact_threshold`: Number of buffered cells after which they are merged into the unique set.
+    - `precision`: Decimal places of the grid cells, coarser levels read the matching precomputed cells.
+    """
+
+    def __init__(
+        self,
+        sampling_rate: int = 5,
+        compact_threshold: int = 1_000_000,
+        precision: int = ROUTEMAP_PRECISION,
+    ):
+        self.logger = get_logger()
+        self.sampling_rate = sampling_rate
+        self.precision = precision
+        self.compact_threshold = compact_threshold
+        self.cells = np.empty(0, dtype=np.int64)
+        self.weights = np.empty(0, dtype=np.int64)
+        self.pending: list[np.ndarray] = []
+        self.pending_weights: list[np.ndarray] = []
+        self.pending_size = 0
+        self.activity_count = 0
 
-    logger.info(f"Generated routemap with {len(points)} unique points.")
+    def add_activity(self, activity: dict) -> np.ndarray:
+        """
+        Add the cells of an activity and return them.
+        """
+        self.activity_count += 1
+
+        # Precomputed cells contain every point, so they can only be used without sampling
+        cells = (
+            get_activity_cells(activity, self.precision)
+            if self.sampling_rate == 1
+            else None
+        )
+        if cells is None:
+            route = get_route_coordinates(activity)
+            if not len(route):
+                return np.empty(0, dtype=np.int64)
+            self.logger.info(
+                f"Processing activity {self.activity_count} {activity['strava_id']} with {len(route)} coordinates."
+            )
+            cells = np.unique(
+                quantise_route(route, self.precision)[1 :: self.sampling_rate]
+            )
+
+        # Every cell of a single activity counts as one visit
+        self._add_pending(cells, np.ones(len(cells), dtype=np.int64))
+        return cells
+
+    def add_cells(
+        self,
+        cells: np.ndarray,
+        activity_count: int,
+        weights: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Merge already quantised cells, e.g. an aggregate of several activities with their visit counts.
+        """
+        self.activity_count += activity_count
+        if weights is None:
+            weights = np.ones(len(cells), dtype=np.int64)
+        self._add_pending(cells, weights)
+        return cells
+
+    def _add_pending(self, cells: np.ndarray, weights: np.ndarray):
+        self.pending.append(cells)
+        self.pending_weights.append(weights)
+        self.pending_size += len(cells)
+        if self.pending_size >= self.compact_threshold:
+            self._compact()
+
+    def _compact(self):
+        if not self.pending:
+            return
+        self.cells, self.weights = merge_weighted_cells(
+            [self.cells, *self.pending], [self.weights, *self.pending_weights]
+        )
+        self.pending = []
+        self.pending_weights = []
+        self.pending_size = 0
 
-    return Routemap(points=points, count=len(points))
+    def build_cells(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the unique cells and the number of distinct activities visiting each of them.
+        """
+        self._compact()
+        self.logger.info(f"Generated routemap with {len(self.cells)} unique points.")
+        return self.cells, self.weights
 
 
 def approx_distance(coord1: tuple[float, float], coord2: tuple[float, float]) -> float:
@@ -0,0 +1,226 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Protocol
+import numpy as np
+
+from api.types.common import AsyncDatabase
+from api.types.diagnostics import CacheMetricsResponse
+from api.types.routes import ActivityType, RouteArea
+from api.utils.cache import CacheStats, TTLCache
+from api.utils.db import DbCollection
+from api.utils.logger import get_logger
+from api.utils.routemap import (
+    decode_cells,
+    decode_weights,
+    encode_cells,
+    encode_weights,
+)
+
+# Stay well below the 16MB MongoDB document limit
+MAX_SHARED_ENTRY_BYTES = 12 * 1024**2
+
+
+class CachedRoutemap:
+    """
+    The result of a routemap query: the unique grid cells and their visit counts,
+    with the matched activity types and count.
+    """
+
+    def __init__(
+        self,
+        cells: np.ndarray,
+        weights: np.ndarray,
+        types: list[str],
+        activity_count: int,
+    ):
+        self.cells = cells
+        self.weights = weights
+        self.types = types
+        self.activity_count = activity_count
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.cells.nbytes + self.weights.nbytes)
+
+
+def routemap_cache_key(
+    user_id: str,
+    types: list[ActivityType] | None,
+    after: datetime | None,
+    before: datetime | None,
+    area: RouteArea | None = None,
+) -> str:
+    type_values = sorted(t.value if hasattr(t, "value") else t for t in types or [])
+    key = [
+        user_id,
+        ",".join(type_values) or "*",
+        after.isoformat() if after else "",
+        before.isoformat() if before else "",
+    ]
+    if area is not None:
+        key.append(",".join(f"{value:.6f}" for value in area.bounds))
+        if area.center is not None and area.radius is not None:
+            key.append(f"{area.center[0]:.6f},{area.center[1]:.6f},{area.radius:.1f}")
+    return "|".join(key)
+
+
+def generation_key(user_id: str) -> str:
+    return f"generation|{user_id}"
+
+
+class RoutemapCache(Protocol):
+    """
+    Backend of the routemap result cache. Entries are keyed with `routemap_cache_key`.
+    Every invalidation of a user bumps the user's generation. A routemap is only stored if the generation
+    read before building it is still current, so a build that overlapped a sync can not cache stale cells.
+    """
+
+    async def get(self, key: str) -> CachedRoutemap | None: ...
+
+    async def generation(self, user_id: str) -> int: ...
+
+    async def set(
+        self, key: str, user_id: str, value: CachedRoutemap, generation: int
+    ): ...
+
+    async def invalidate_user(self, user_id: str): ...
+
+    def metrics(self) -> CacheMetricsResponse: ...
+
+
+class InMemoryRoutemapCache:
+    """
+    Routemap cache in the API process, evicting the least recently used entries
+    when the entry count or the total size of the cached cells is exceeded.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.cache: TTLCache[str, CachedRoutemap] = TTLCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            max_size=max_bytes,
+            size_of=lambda value: value.nbytes,
+        )
+        self.generations: dict[str, int] = {}
+
+    async def get(self, key: str) -> CachedRoutemap | None:
+        return self.cache.get(key)
+
+    async def generation(self, user_id: str) -> int:
+        return self.generations.get(user_id, 0)
+
+    async def set(self, key: str, user_id: str, value: CachedRoutemap, generation: int):
+        if generation != self.generations.get(user_id, 0):
+            return
+        self.cache.set(key, value)
+
+    async def invalidate_user(self, user_id: str):
+        self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        self.cache.delete_where(lambda key: key.startswith(f"{user_id}|"))
+
+    def metrics(self) -> CacheMetricsResponse:
+        return self.cache.stats.to_response(len(self.cache), self.cache.size)
+
+
+class MongoRoutemapCache:
+    """
+    Routemap cache stored in MongoDB, shared by every API process using the same database.
+    Expired entries are removed by a TTL index, eviction is left to it as well.
+    """
+
+    def __init__(self, db: AsyncDatabase, ttl_seconds: float):
+        self.collection = db.get_collection(DbCollection.ROUTEMAP_CACHE)
+        self.ttl_seconds = ttl_seconds
+        self.stats = CacheStats()
+        self.logger = get_logger()
+
+    async def get(self, key: str) -> CachedRoutemap | None:
+        entry = await self.collection.find_one(
+            {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+        )
+        # Entries cached before weights were stored are rebuilt
+        if not entry or entry.get("weights") is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        return CachedRoutemap(
+            cells=decode_cells(entry["cells"]),
+            weights=decode_weights(entry["weights"]),
+            types=entry["types"],
+            activity_count=entry["activity_count"],
+        )
+
+    async def generation(self, user_id: str) -> int:
+        # Kept without `user_id` and `expires_at`, so invalidations and the TTL index leave it alone
+        entry = await self.collection.find_one(
+            {"key": generation_key(user_id)}, {"generation": 1}
+        )
+        return entry["generation"] if entry else 0
+
+    async def set(self, key: str, user_id: str, value: CachedRoutemap, generation: int):
+        if value.nbytes > MAX_SHARED_ENTRY_BYTES:
+            self.logger.info(
+                f"Routemap of {value.nbytes} bytes is too large for the shared cache, not caching."
+            )
+            return
+        if await self.generation(user_id) != generation:
+            return
+
+        await self.collection.update_one(
+            {"key": key},
+            {
+                "$set": {
+                    "user_id": user_id,
+                    "cells": encode_cells(value.cells),
+                    "weights": encode_weights(value.weights),
+                    "types": value.types,
+                    "activity_count": value.activity_count,
+                    "expires_at": datetime.now(timezone.utc)
+                    + timedelta(seconds=self.ttl_seconds),
+                }
+            },
+            upsert=True,
+        )
+        # An invalidation may have run while this entry was built or written
+        if await self.generation(user_id) != generation:
+            await self.collection.delete_one({"key": key})
+
+    async def invalidate_user(self, user_id: str):
+        await self.collection.update_one(
+            {"key": generation_key(user_id)},
+            {"$inc": {"generation": 1}},
+            upsert=True,
+        )
+        result = await self.collection.delete_many({"user_id": user_id})
+        self.stats.invalidations += result.deleted_count
+
+    def metrics(self) -> CacheMetricsResponse:
+        return self.stats.to_response(entries=0, size=0)
+
+
+def create_routemap_cache(db: AsyncDatabase) -> RoutemapCache | None:
+    """
+    Create the routemap cache backend configured with `ROUTEMAP_CACHE_BACKEND` (memory, mongo or none).
+    """
+    logger = get_logger()
+    backend = os.getenv("ROUTEMAP_CACHE_BACKEND", "memory")
+    ttl_seconds = float(os.getenv("ROUTEMAP_CACHE_TTL", "3600"))
+
+    if backend == "memory":
+        max_entries = int(os.getenv("ROUTEMAP_CACHE_MAX_ENTRIES", "256"))
+        max_bytes = int(os.getenv("ROUTEMAP_CACHE_MAX_MB", "256")) * 1024**2
+        logger.info(
+            f"Using in-memory routemap cache ({max_entries} entries, {max_bytes // 1024**2} MB, TTL {ttl_seconds}s)."
+        )
+        return InMemoryRoutemapCache(max_entries, max_bytes, ttl_seconds)
+
+    if backend == "mongo":
+        logger.info(f"Using MongoDB routemap cache (TTL {ttl_seconds}s).")
+        return MongoRoutemapCache(db, ttl_seconds)
+
+    if backend == "none":
+        logger.info("Routemap cache is disabled.")
+        return None
+
+    raise ValueError(f"Unknown ROUTEMAP_CACHE_BACKEND: {backend}")
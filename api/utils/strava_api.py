@@ -1,17 +1,33 @@
-from fastapi import HTTPException
+import asyncio
+import os
+from typing import AsyncIterator, Callable
+from fastapi import HTTPException, status
 import httpx
 
 from api.utils.logger import get_logger
+from api.utils.strava_client import StravaHttpClient, StravaHttpMetrics
+
+# Largest page size of the Strava list endpoints
+MAX_PER_PAGE = 200
+
+
+def get_list_page_window() -> int:
+    """
+    Number of activity list pages requested concurrently ahead of the page being read.
+    """
+    return max(1, int(os.getenv("STRAVA_LIST_PAGE_WINDOW", "3")))
 
 
 class StravaApi:
     """
     A class to handle Strava API interactions.
+    Requests go through the shared, pooled `StravaHttpClient`.
     """
 
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, http: StravaHttpClient):
         self.access_token = access_token
-        self.base_url = "https://www.strava.com/api/v3"
+        self.http = http
+        self.metrics = StravaHttpMetrics()
         self.logger = get_logger()
 
     async def get_athlete(self):
@@ -39,27 +55,96 @@ class StravaApi:
 
     async def get_all_activities(
         self,
-        per_page: int = 50,
+        per_page: int = MAX_PER_PAGE,
         after: int | None = None,
         before: int | None = None,
+        on_page: Callable[[], None] | None = None,
     ):
         """
         Fetch all activities for the authenticated athlete, handling pagination.
+        `on_page` is called after every fetched page, e.g. to report progress.
         """
-        all_activities = []
-        page = 1
-        while True:
-            activities = await self.get_activities(
-                page=page,
-                per_page=per_page,
-                after=after,
-                before=before,
+        return [
+            activity
+            async for activity in self.iter_activities(
+                per_page=per_page, after=after, before=before, on_page=on_page
             )
-            if not activities:
-                break
-            all_activities.extend(activities)
-            page += 1
-        return all_activities
+        ]
+
+    async def iter_activities(
+        self,
+        per_page: int = MAX_PER_PAGE,
+        after: int | None = None,
+        before: int | None = None,
+        on_page: Callable[[], None] | None = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Yield the activities of the authenticated athlete as their pages arrive, see `iter_activity_pages`.
+        """
+        async for page in self.iter_activity_pages(
+            per_page=per_page, after=after, before=before, on_page=on_page
+        ):
+            for activity in page:
+                yield activity
+
+    async def iter_activity_pages(
+        self,
+        per_page: int = MAX_PER_PAGE,
+        after: int | None = None,
+        before: int | None = None,
+        on_page: Callable[[], None] | None = None,
+        window: int | None = None,
+    ) -> AsyncIterator[list[dict]]:
+        """
+        Yield the pages of activities in order until the first empty page.
+        Up to `window` pages are requested concurrently ahead of the page being read. After a page
+        shorter than `per_page`, which is most likely the last one, no more pages are requested ahead,
+        so the speculation costs few requests of the rate limit.
+        """
+        if window is None:
+            window = get_list_page_window()
+
+        def fetch_page(page: int) -> asyncio.Task:
+            return asyncio.create_task(
+                self.get_activities(
+                    page=page, per_page=per_page, after=after, before=before
+                )
+            )
+
+        in_flight: dict[int, asyncio.Task] = {}
+        next_page = 1
+        page = 1
+        speculate = True
+        try:
+            while True:
+                while next_page < page + (window if speculate else 1):
+                    in_flight[next_page] = fetch_page(next_page)
+                    next_page += 1
+
+                activities = await in_flight.pop(page)
+                if on_page is not None:
+                    on_page()
+                if not activities:
+                    break
+                if len(activities) < per_page:
+                    speculate = False
+                yield activities
+                page += 1
+        finally:
+            for task in in_flight.values():
+                task.cancel()
+
+    async def get_activity(self, activity_id: int) -> dict | None:
+        """
+        Fetch the summary of a single activity, e.g. for an activity reported by the webhook.
+        Returns None if Strava does not know the activity (anymore).
+        """
+        try:
+            return await self._get_request(f"/activities/{activity_id}")
+        except HTTPException as e:
+            if e.status_code == status.HTTP_404_NOT_FOUND:
+                return None
+            raise
 
     async def get_activity_latlng_stream(self, activity_id: int):
         """
@@ -74,21 +159,23 @@ class StravaApi:
         """
         Generic GET request to the Strava API.
         """
-        url = f"{self.base_url}{endpoint}"
-        headers = {"Authorization": f"Bearer {self.access_token}"}
         self.logger.info(
             f"Making GET request to Strava API: {endpoint} with params: {params}"
         )
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, params=params)
-            try:
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as exc:
-                self.logger.error(
-                    f"Error during Strava API call {url}: {exc.response.status_code} - {exc.response.text}"
-                )
-                raise HTTPException(
-                    status_code=exc.response.status_code,
-                    detail=f"Strava API error: {exc.response.text}",
-                )
+        response = await self.http.get(
+            endpoint,
+            access_token=self.access_token,
+            params=params,
+            request_metrics=self.metrics,
+        )
+        try:
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as exc:
+            self.logger.error(
+                f"Error during Strava API call {endpoint}: {exc.response.status_code} - {exc.response.text}"
+            )
+            raise HTTPException(
+                status_code=exc.response.status_code,
+                detail=f"Strava API error: {exc.response.text}",
+            )
@@ -0,0 +1,131 @@
+import importlib.util
+import os
+from typing import Any
+import httpx
+
+from api.types.diagnostics import StravaHttpMetricsResponse
+from api.utils.logger import get_logger
+from api.utils.strava_rate_limit import StravaRateLimiter
+
+
+class StravaHttpMetrics:
+    """
+    Counters for requests and connection setup on the Strava HTTP client,
+    used to confirm that pooled connections are actually reused.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def record_request(self):
+        self.requests += 1
+
+    def record_trace_event(self, event_name: str):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    def to_response(self) -> StravaHttpMetricsResponse:
+        reused = max(self.requests - self.connections_opened, 0)
+        return StravaHttpMetricsResponse(
+            requests=self.requests,
+            connections_opened=self.connections_opened,
+            tls_handshakes=self.tls_handshakes,
+            connection_reuse_ratio=(reused / self.requests) if self.requests else 0.0,
+        )
+
+
+class StravaHttpClient:
+    """
+    Process-wide pooled HTTP client for the Strava API.
+    It is created once in the app lifespan and shared by every StravaApi instance,
+    so connections (and TLS sessions) are kept alive between requests and syncs.
+    All requests are scheduled through the shared rate limiter.
+    """
+
+    def __init__(self):
+        self.logger = get_logger()
+        self.metrics = StravaHttpMetrics()
+        self.rate_limiter = StravaRateLimiter()
+        self.max_rate_limit_retries = int(
+            os.getenv("STRAVA_RATE_LIMIT_MAX_RETRIES", "3")
+        )
+        self.base_url = os.getenv("STRAVA_API_URL", "https://www.strava.com/api/v3")
+
+        http2 = os.getenv("STRAVA_HTTP2", "false").lower() == "true"
+        if http2 and importlib.util.find_spec("h2") is None:
+            self.logger.warning(
+                "STRAVA_HTTP2 is enabled but the 'h2' package is not installed, falling back to HTTP/1.1."
+            )
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("STRAVA_HTTP_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(
+                os.getenv("STRAVA_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10")
+            ),
+            keepalive_expiry=float(os.getenv("STRAVA_HTTP_KEEPALIVE_EXPIRY", "60")),
+        )
+        timeout = httpx.Timeout(
+            float(os.getenv("STRAVA_HTTP_TIMEOUT", "30")),
+            connect=float(os.getenv("STRAVA_HTTP_CONNECT_TIMEOUT", "5")),
+        )
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url, limits=limits, timeout=timeout, http2=http2
+        )
+        self.logger.info(
+            f"Strava HTTP client created for {self.base_url} (HTTP/2: {http2}, limits: {limits})"
+        )
+
+    async def get(
+        self,
+        endpoint: str,
+        access_token: str,
+        params: dict | None = None,
+        request_metrics: StravaHttpMetrics | None = None,
+    ) -> httpx.Response:
+        """
+        Send a GET request through the shared connection pool.
+        `request_metrics` can be passed to additionally count the request for a single caller, e.g. a sync.
+        A 429 response pauses until the rate limit window resets and the request is retried.
+        """
+
+        async def trace(event_name: str, info: dict[str, Any]):
+            self.metrics.record_trace_event(event_name)
+            if request_metrics is not None:
+                request_metrics.record_trace_event(event_name)
+
+        retries = 0
+        while True:
+            await self.rate_limiter.acquire()
+
+            self.metrics.record_request()
+            if request_metrics is not None:
+                request_metrics.record_request()
+
+            response = await self.client.get(
+                endpoint,
+                headers={"Authorization": f"Bearer {access_token}"},
+                params=params,
+                extensions={"trace": trace},
+            )
+            self.rate_limiter.update_from_headers(response.headers)
+
+            if (
+                response.status_code != httpx.codes.TOO_MANY_REQUESTS
+                or retries >= self.max_rate_limit_retries
+            ):
+                return response
+
+            retries += 1
+            self.logger.warning(
+                f"Strava API rate limited {endpoint}, retrying after the limit resets ({retries}/{self.max_rate_limit_retries})."
+            )
+            self.rate_limiter.mark_exhausted()
+
+    async def close(self):
+        await self.client.aclose()
+        self.logger.info("Strava HTTP client closed.")
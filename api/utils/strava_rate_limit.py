@@ -0,0 +1,167 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+import httpx
+
+from api.types.diagnostics import RateLimitWindowResponse, StravaRateLimitResponse
+from api.utils.logger import get_logger
+
+
+def next_quarter_hour(now: datetime) -> datetime:
+    """
+    Strava's short term limit resets at natural 15-minute marks (0, 15, 30 and 45 past the hour).
+    """
+    start = now.replace(minute=now.minute - now.minute % 15, second=0, microsecond=0)
+    return start + timedelta(minutes=15)
+
+
+def next_midnight(now: datetime) -> datetime:
+    """
+    Strava's daily limit resets at midnight UTC.
+    """
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start + timedelta(days=1)
+
+
+class RateLimitWindow:
+    """
+    Token bucket for one Strava rate limit window. Tokens are taken locally before each request
+    and the bucket is corrected with the usage reported by Strava in the response headers.
+    """
+
+    def __init__(
+        self, name: str, limit: int, next_reset: Callable[[datetime], datetime]
+    ):
+        self.name = name
+        self.limit = limit
+        self.usage = 0
+        self.next_reset = next_reset
+        self.resets_at = next_reset(datetime.now(timezone.utc))
+
+    def refresh(self, now: datetime):
+        if now >= self.resets_at:
+            self.usage = 0
+            self.resets_at = self.next_reset(now)
+
+    def remaining(self) -> int:
+        return self.limit - self.usage
+
+    def to_response(self) -> RateLimitWindowResponse:
+        return RateLimitWindowResponse(
+            limit=self.limit,
+            usage=self.usage,
+            resets_at=self.resets_at.isoformat(),
+        )
+
+
+class StravaRateLimiter:
+    """
+    Process-wide scheduler for Strava API requests.
+    Strava limits apply to the whole application, so every request must take a token from both
+    the 15-minute and the daily window. When a window is exhausted, callers wait until it resets
+    instead of failing, which lets long syncs pause and resume on their own.
+    """
+
+    def __init__(self):
+        self.logger = get_logger()
+        self.short_window = RateLimitWindow(
+            "15-minute",
+            int(os.getenv("STRAVA_RATE_LIMIT_15MIN", "100")),
+            next_quarter_hour,
+        )
+        self.daily_window = RateLimitWindow(
+            "daily",
+            int(os.getenv("STRAVA_RATE_LIMIT_DAILY", "1000")),
+            next_midnight,
+        )
+        self.safety_margin = int(os.getenv("STRAVA_RATE_LIMIT_SAFETY_MARGIN", "2"))
+        self.paused_until: datetime | None = None
+        self.pause_count = 0
+        self.paused_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def windows(self) -> list[RateLimitWindow]:
+        return [self.short_window, self.daily_window]
+
+    async def acquire(self):
+        """
+        Take a token from every window, waiting for the window reset if any of them is exhausted.
+        """
+        async with self._lock:
+            while True:
+                now = datetime.now(timezone.utc)
+                resume_at: datetime | None = None
+                for window in self.windows:
+                    window.refresh(now)
+                    if window.remaining() <= self.safety_margin:
+                        if resume_at is None or window.resets_at > resume_at:
+                            resume_at = window.resets_at
+
+                if resume_at is None:
+                    for window in self.windows:
+                        window.usage += 1
+                    return
+
+                wait_seconds = (resume_at - now).total_seconds()
+                self.logger.warning(
+                    f"Strava rate limit reached, pausing requests for {wait_seconds:.0f}s until {resume_at.isoformat()}."
+                )
+                self.paused_until = resume_at
+                self.pause_count += 1
+                self.paused_seconds += wait_seconds
+                await asyncio.sleep(wait_seconds)
+                self.paused_until = None
+
+    def update_from_headers(self, headers: httpx.Headers):
+        """
+        Sync the buckets with the limits and usage reported by Strava.
+        Read limits are preferred as this API only sends GET requests.
+        """
+        limit_header = headers.get("X-ReadRateLimit-Limit") or headers.get(
+            "X-RateLimit-Limit"
+        )
+        usage_header = headers.get("X-ReadRateLimit-Usage") or headers.get(
+            "X-RateLimit-Usage"
+        )
+        if not limit_header or not usage_header:
+            return
+
+        try:
+            limits = [int(value) for value in limit_header.split(",")]
+            usages = [int(value) for value in usage_header.split(",")]
+        except ValueError:
+            self.logger.warning(
+                f"Could not parse Strava rate limit headers: {limit_header} / {usage_header}"
+            )
+            return
+
+        now = datetime.now(timezone.utc)
+        for window, limit, usage in zip(self.windows, limits, usages):
+            window.refresh(now)
+            window.limit = limit
+            # Requests still in flight are already counted locally but not yet by Strava.
+            window.usage = max(window.usage, usage)
+
+    def mark_exhausted(self):
+        """
+        Called on a 429 response, after its headers were applied: treat the window that ran out as used up,
+        so callers wait for its reset. That is the daily window if Strava reports its usage at the limit,
+        otherwise the short window.
+        """
+        window = (
+            self.daily_window
+            if self.daily_window.remaining() <= 0
+            else self.short_window
+        )
+        window.usage = window.limit
+
+    def to_response(self) -> StravaRateLimitResponse:
+        return StravaRateLimitResponse(
+            short_window=self.short_window.to_response(),
+            daily_window=self.daily_window.to_response(),
+            paused_until=self.paused_until.isoformat() if self.paused_until else None,
+            pause_count=self.pause_count,
+            paused_seconds=self.paused_seconds,
+        )
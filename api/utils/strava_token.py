@@ -0,0 +1,41 @@
+import base64
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from api.utils.auth import get_api_secret
+
+_token_cipher: Fernet | None = None
+
+
+def get_token_cipher() -> Fernet:
+    """
+    Cipher of the Strava tokens stored for the webhook and the background sync jobs,
+    with a key derived from `API_SECRET` once.
+    """
+    global _token_cipher
+    if _token_cipher is None:
+        key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"strava-token",
+        ).derive(get_api_secret().encode())
+        _token_cipher = Fernet(base64.urlsafe_b64encode(key))
+    return _token_cipher
+
+
+def encrypt_strava_token(strava_token: str) -> str:
+    return get_token_cipher().encrypt(strava_token.encode()).decode()
+
+
+def decrypt_strava_token(encrypted: str | None) -> str | None:
+    """
+    Decrypt a stored Strava token, or None if there is none or it was encrypted with another `API_SECRET`.
+    """
+    if not encrypted:
+        return None
+    try:
+        return get_token_cipher().decrypt(encrypted.encode()).decode()
+    except InvalidToken:
+        return None
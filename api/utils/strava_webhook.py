@@ -0,0 +1,51 @@
+import os
+
+
+def get_webhook_verify_token() -> str | None:
+    """
+    Token Strava sends back when validating the webhook subscription. The webhook is disabled without it.
+    """
+    return os.getenv("STRAVA_WEBHOOK_VERIFY_TOKEN") or None
+
+
+def get_webhook_subscription_id() -> int | None:
+    """
+    Id of the Strava webhook subscription. Events of other subscriptions are rejected.
+    """
+    subscription_id = os.getenv("STRAVA_WEBHOOK_SUBSCRIPTION_ID")
+    return int(subscription_id) if subscription_id else None
+
+
+def get_webhook_path_secret() -> str | None:
+    """
+    Last segment of the webhook callback URL, only known to Strava, so nobody else can post events.
+    """
+    return os.getenv("STRAVA_WEBHOOK_PATH_SECRET") or None
+
+
+def check_webhook_config():
+    """
+    Raise a ValueError if the webhook is enabled by the verify token but not fully configured.
+    """
+    if get_webhook_verify_token() is None:
+        return
+    missing = [
+        name
+        for name, value in [
+            ("STRAVA_WEBHOOK_SUBSCRIPTION_ID", get_webhook_subscription_id()),
+            ("STRAVA_WEBHOOK_PATH_SECRET", get_webhook_path_secret()),
+        ]
+        if value is None
+    ]
+    if missing:
+        raise ValueError(
+            f"{' and '.join(missing)} must be set with STRAVA_WEBHOOK_VERIFY_TOKEN."
+        )
+
+
+def webhooks_enabled() -> bool:
+    return (
+        get_webhook_verify_token() is not None
+        and get_webhook_subscription_id() is not None
+        and get_webhook_path_secret() is not None
+    )
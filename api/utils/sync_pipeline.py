@@ -0,0 +1,221 @@
+import asyncio
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable
+
+from api.types.routes import SyncStageStats
+
+# Put on a queue after the last item
+END = object()
+
+StageHandler = Callable[[Any], Awaitable[Iterable[Any]]]
+StageFinisher = Callable[[], Awaitable[Iterable[Any]]]
+
+
+class StageQueue(asyncio.Queue):
+    """
+    Bounded queue feeding a pipeline stage, remembering the most items it has held.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self.max_depth = 0
+
+    def put_nowait(self, item: Any):
+        super().put_nowait(item)
+        self.max_depth = max(self.max_depth, self.qsize())
+
+
+class PipelineStage:
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        input: StageQueue | None,
+        handler: StageHandler | None = None,
+        finish: StageFinisher | None = None,
+        source: AsyncIterable | None = None,
+    ):
+        self.name = name
+        self.workers = workers
+        self.input = input
+        self.output: StageQueue | None = None
+        self.handler = handler
+        self.finish = finish
+        self.source = source
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        self._running = workers
+
+    def stats(self) -> SyncStageStats:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return SyncStageStats(
+            workers=self.workers,
+            processed=self.processed,
+            per_second=round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            busy_seconds=round(self.busy_seconds, 3),
+            queue_depth=self.input.qsize() if self.input is not None else 0,
+            max_queue_depth=self.input.max_depth if self.input is not None else 0,
+        )
+
+
+class SyncPipeline:
+    """
+    Chain of stages connected by bounded queues, so that every stage works on its own items
+    while the others work on theirs. A stage waiting on a full queue holds back the stages before it.
+
+    The first stage is an async iterable, every next stage takes one item at a time from the
+    queue of the previous one and returns the items to pass on. A stage can have several workers
+    and a `finish` callback that is awaited after its last item, e.g. to flush a batch.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.stages: list[PipelineStage] = []
+
+    def source(self, name: str, items: AsyncIterable):
+        self.stages.append(PipelineStage(name, 1, None, source=items))
+
+    def stage(
+        self,
+        name: str,
+        handler: StageHandler,
+        workers: int = 1,
+        finish: StageFinisher | None = None,
+        queue_size: int | None = None,
+    ):
+        if not self.stages:
+            raise ValueError("The pipeline has to start with a source.")
+        queue = StageQueue(queue_size or self.queue_size)
+        self.stages[-1].output = queue
+        self.stages.append(PipelineStage(name, workers, queue, handler, finish))
+
+    def stats(self) -> dict[str, SyncStageStats]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"{name}: {stats.processed} ({stats.per_second}/s, queue {stats.queue_depth}/{stats.max_queue_depth})"
+            for name, stats in self.stats().items()
+        )
+
+    async def run(
+        self,
+        on_stats: Callable[[dict[str, SyncStageStats]], Awaitable[None]] | None = None,
+        stats_interval: float = 2.0,
+    ):
+        """
+        Run every stage until the source is exhausted and all items went through.
+        `on_stats` is awaited with the stage statistics every `stats_interval` seconds and at the end.
+
+        The first error of a stage stops the stages before it and drops the items queued for it.
+        The other workers of the stage finish the item they are on, and the stages after it
+        finish the items already passed to them. The error is raised once they are done.
+        """
+        # Index of the stage every task belongs to
+        task_stages: dict[asyncio.Task, int] = {}
+        for index, stage in enumerate(self.stages):
+            stage.started = time.monotonic()
+            if stage.source is not None:
+                task_stages[asyncio.create_task(self._run_source(stage))] = index
+            else:
+                for _ in range(stage.workers):
+                    task_stages[asyncio.create_task(self._run_worker(stage))] = index
+
+        pending = set(task_stages)
+        error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=stats_interval,
+                    return_when=asyncio.FIRST_EXCEPTION,
+                )
+                for task in done:
+                    if task.cancelled() or task.exception() is None:
+                        continue
+                    error = error or task.exception()
+                    index = task_stages[task]
+                    await self._stop_before(task_stages, index)
+                    stage = self.stages[index]
+                    if stage._running == 0 and stage.output is not None:
+                        # No worker is left to pass the end on
+                        end = asyncio.create_task(stage.output.put(END))
+                        task_stages[end] = index
+                        pending.add(end)
+                pending = {task for task in pending if not task.done()}
+                if on_stats is not None:
+                    await on_stats(self.stats())
+        finally:
+            for task in task_stages:
+                task.cancel()
+            await asyncio.gather(*task_stages, return_exceptions=True)
+        if error is not None:
+            raise error
+
+    async def _stop_before(self, task_stages: dict[asyncio.Task, int], index: int):
+        """
+        Cancel the stages before the given one and replace the items queued for it by the end marker.
+        """
+        tasks = [task for task, stage in task_stages.items() if stage < index]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        stage = self.stages[index]
+        if stage.input is None:
+            return
+        while not stage.input.empty():
+            stage.input.get_nowait()
+        stage.input.put_nowait(END)
+
+    async def _emit(self, stage: PipelineStage, items: Iterable[Any]):
+        if stage.output is None:
+            return
+        for item in items:
+            await stage.output.put(item)
+
+    async def _run_source(self, stage: PipelineStage):
+        iterator = aiter(stage.source)
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    item = await anext(iterator)
+                except StopAsyncIteration:
+                    break
+                stage.busy_seconds += time.monotonic() - started
+                stage.processed += 1
+                await self._emit(stage, [item])
+        finally:
+            stage._running -= 1
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+        await self._stage_done(stage)
+
+    async def _run_worker(self, stage: PipelineStage):
+        try:
+            while True:
+                item = await stage.input.get()
+                if item is END:
+                    # Leave the end marker for the other workers of the stage
+                    stage.input.put_nowait(END)
+                    break
+                started = time.monotonic()
+                outputs = await stage.handler(item)
+                stage.busy_seconds += time.monotonic() - started
+                stage.processed += 1
+                await self._emit(stage, outputs)
+        finally:
+            stage._running -= 1
+
+        if stage._running == 0:
+            stage.input.get_nowait()
+            await self._stage_done(stage)
+
+    async def _stage_done(self, stage: PipelineStage):
+        if stage.finish is not None:
+            await self._emit(stage, await stage.finish())
+        stage.finished = time.monotonic()
+        if stage.output is not None:
+            await stage.output.put(END)
@@ -0,0 +1,87 @@
+import bisect
+import time
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from api.types.routes import SyncProgress, SyncStageStats
+
+
+class SyncProgressTracker:
+    """
+    Counts what a sync has done so far.
+    When `on_flush` is given, the counters are handed to it at most every `flush_interval` seconds
+    (and always on a forced flush), e.g. to persist the progress of a background sync job.
+    """
+
+    def __init__(
+        self,
+        progress: SyncProgress | None = None,
+        on_flush: Callable[[SyncProgress], Awaitable[None]] | None = None,
+        flush_interval: float = 2.0,
+    ):
+        self.progress = progress or SyncProgress()
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def page_fetched(self):
+        self.progress.pages_fetched += 1
+
+    def stream_fetched(self):
+        self.progress.streams_fetched += 1
+
+    def activity_inserted(self, count: int = 1):
+        self.progress.inserted += count
+
+    def activity_skipped(self):
+        self.progress.skipped += 1
+
+    def error(self):
+        self.progress.errors += 1
+
+    def stages_updated(self, stages: dict[str, SyncStageStats]):
+        self.progress.stages = stages
+
+    async def flush(self, force: bool = False):
+        if self.on_flush is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        await self.on_flush(self.progress)
+
+
+class SyncWatermark:
+    """
+    Latest activity start time up to which every listed activity is finished (stored or skipped).
+    Activities are listed oldest first, but finish out of order in the sync pipeline, so an
+    activity that is still in flight holds the watermark back until it is done.
+    """
+
+    def __init__(self):
+        self._listed: list[datetime] = []
+        self._pending: dict[int, datetime] = {}
+
+    def listed(self, strava_id: int, start_date: datetime):
+        bisect.insort(self._listed, start_date)
+        self._pending[strava_id] = start_date
+
+    def done(self, strava_id: int):
+        self._pending.pop(strava_id, None)
+
+    @property
+    def value(self) -> datetime | None:
+        if not self._pending:
+            return self._listed[-1] if self._listed else None
+        index = bisect.bisect_left(self._listed, min(self._pending.values()))
+        return self._listed[index - 1] if index else None
+
+    def advance(self) -> datetime | None:
+        """
+        Return the watermark and drop the start times before it, which can not hold it back anymore.
+        """
+        value = self.value
+        if value is not None:
+            del self._listed[: bisect.bisect_left(self._listed, value)]
+        return value
@@ -0,0 +1,166 @@
+"""
+Benchmark of the hot queries with and without the startup indexes, on a seeded MongoDB database.
+
+Usage:
+    python -m bench.index_queries [--activities 100000] [--users 20] [--repeat 20] [--keep]
+
+Reads MONGODB_URI and MONGODB_NAME from the environment or `.env`, e.g. of the dev db (`./dev-db.sh start`),
+and seeds a separate `<MONGODB_NAME>_bench` database, dropped at the end unless `--keep` is given.
+Every query of `get_hot_queries` is run `--repeat` times without indexes, then again after creating the indexes
+of `INDEXES`, and the median time is reported with the documents examined according to explain().
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+
+from api.modules.query_plans import explain_query, get_hot_queries
+from api.types.common import AsyncDatabase
+from api.utils.db import INDEXES, DbCollection
+from api.utils.routemap import (
+    compute_activity_cells,
+    compute_route_bounds,
+    encode_route,
+)
+
+ACTIVITY_TYPES = ["Walk", "Run", "Ride"]
+ROUTE_POINTS = 200
+SEED_BATCH_SIZE = 5000
+
+
+def make_activity(rng: np.random.Generator, user_id: str, strava_id: int) -> dict:
+    origin = np.array([47.5, 19.0]) + rng.uniform(-0.5, 0.5, 2)
+    route = np.round(
+        origin + np.cumsum(rng.uniform(-1e-4, 1e-4, (ROUTE_POINTS, 2)), axis=0), 6
+    )
+    start_date = datetime(2020, 1, 1, tzinfo=timezone.utc) + timedelta(
+        minutes=int(rng.integers(6 * 365 * 24 * 60))
+    )
+    return {
+        "user_id": user_id,
+        "strava_id": strava_id,
+        "name": f"Activity {strava_id}",
+        "distance": float(rng.uniform(1000, 50000)),
+        "type": ACTIVITY_TYPES[strava_id % len(ACTIVITY_TYPES)],
+        "start_date": start_date,
+        "route_encoded": encode_route(route),
+        "cells": compute_activity_cells(route),
+        "bounds": compute_route_bounds(route),
+    }
+
+
+async def seed(db: AsyncDatabase, activity_count: int, user_count: int) -> list[dict]:
+    rng = np.random.default_rng(1)
+    users = [
+        {
+            "id": str(uuid.uuid4()),
+            "username": f"bench{index}",
+            "email": f"bench{index}@example.com",
+            "api_key_hash": uuid.uuid4().hex,
+        }
+        for index in range(user_count)
+    ]
+    await db.get_collection(DbCollection.USERS).insert_many(users)
+
+    activities_collection = db.get_collection(DbCollection.ACTIVITIES)
+    batch = []
+    for strava_id in range(activity_count):
+        batch.append(make_activity(rng, users[strava_id % user_count]["id"], strava_id))
+        if len(batch) >= SEED_BATCH_SIZE:
+            await activities_collection.insert_many(batch)
+            batch = []
+    if batch:
+        await activities_collection.insert_many(batch)
+    return users
+
+
+async def create_indexes(db: AsyncDatabase):
+    for collection_name, indexes in INDEXES.items():
+        await db.get_collection(collection_name).create_indexes(indexes)
+
+
+async def time_queries(db: AsyncDatabase, user: dict, repeat: int) -> dict[str, tuple]:
+    results = {}
+    for name, collection_name, filter_query, projection in await get_hot_queries(
+        db, user
+    ):
+        collection = db.get_collection(collection_name)
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await collection.find(filter_query, projection).to_list()
+            durations.append(time.perf_counter() - start)
+        report = await explain_query(
+            db, name, collection_name, filter_query, projection
+        )
+        results[name] = (statistics.median(durations) * 1000, report)
+    return results
+
+
+async def run(args: argparse.Namespace):
+    mongodb_uri = os.getenv("MONGODB_URI")
+    mongodb_name = os.getenv("MONGODB_NAME")
+    if not mongodb_uri or not mongodb_name:
+        raise ValueError(
+            "MONGODB_URI and MONGODB_NAME environment variables must be set."
+        )
+
+    client = AsyncMongoClient(mongodb_uri)
+    bench_name = f"{mongodb_name}_bench"
+    await client.drop_database(bench_name)
+    db = client.get_database(bench_name)
+    try:
+        start = time.perf_counter()
+        users = await seed(db, args.activities, args.users)
+        print(
+            f"Seeded {args.activities} activities of {args.users} users into {bench_name} in {time.perf_counter() - start:.1f}s"
+        )
+        user = users[0]
+
+        without_indexes = await time_queries(db, user, args.repeat)
+        start = time.perf_counter()
+        await create_indexes(db)
+        print(f"Created the indexes in {time.perf_counter() - start:.1f}s")
+        with_indexes = await time_queries(db, user, args.repeat)
+
+        print(
+            f"\nMedian of {args.repeat} runs, documents examined for the results of one user:"
+        )
+        for name, (before_ms, before) in without_indexes.items():
+            after_ms, after = with_indexes[name]
+            print(f"\n{name}")
+            print(
+                f"  without indexes: {before_ms:8.2f} ms, {before.docs_examined} docs examined, {' <- '.join(before.stages)}"
+            )
+            print(
+                f"  with indexes:    {after_ms:8.2f} ms, {after.docs_examined} docs examined, {' <- '.join(after.stages)}"
+                f" ({', '.join(after.indexes) or '-'})"
+            )
+            print(f"  returned {after.returned}, {before_ms / after_ms:.1f}x faster")
+    finally:
+        if not args.keep:
+            await client.drop_database(bench_name)
+        await client.close()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--activities", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the seeded database afterwards"
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
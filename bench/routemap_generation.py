@@ -0,0 +1,118 @@
+"""
+Benchmark of the routemap generation before and after it was vectorised with NumPy.
+
+Usage:
+    python -m bench.routemap_generation [--points 10000,1000000,10000000] [--points-per-activity 1000] [--sampling-rate 1]
+
+Activities are random walks of a few cities, read as lists of [lat, lng] pairs like from MongoDB.
+The old generation rounds every coordinate and adds it to a set of tuples, then the `Routemap` response
+is serialised by Pydantic. The new one quantises the routes with `RoutemapBuilder` and serialises the cells
+with orjson, as `GET /routes` does for activities without precomputed cells. The unique point counts can
+differ slightly, as `round` and `np.rint` do not agree on every coordinate halfway between two cells.
+"""
+
+import argparse
+import gc
+import time
+import numpy as np
+import orjson
+
+from api.types.routes import Coords, Routemap
+from api.utils.routemap import RoutemapBuilder, cells_to_routemap_json
+
+# Centers of the random walks, so the routes overlap like the activities of a real user
+CITIES = [(47.50, 19.04), (48.21, 16.37), (52.52, 13.40), (45.46, 9.19)]
+STEP = 1e-4
+
+
+def make_routes(point_count: int, points_per_activity: int) -> list[list]:
+    rng = np.random.default_rng(1)
+    routes = []
+    for start in range(0, point_count, points_per_activity):
+        size = min(points_per_activity, point_count - start)
+        center = np.array(CITIES[rng.integers(len(CITIES))])
+        origin = center + rng.uniform(-0.05, 0.05, 2)
+        walk = origin + np.cumsum(rng.uniform(-STEP, STEP, (size, 2)), axis=0)
+        routes.append(np.round(walk, 6).tolist())
+    return routes
+
+
+def generate_routemap_old(activities: list[dict], sampling_rate: int) -> Routemap:
+    """
+    The routemap generation before NumPy, without its logging.
+    """
+    points: set[Coords] = set()
+    for activity in activities:
+        route = activity["route"]
+        if not route:
+            continue
+        for entry in route[1::sampling_rate]:
+            coords: Coords = (
+                round(entry[0], 4),
+                round(entry[1], 4),
+            )
+            points.add(coords)
+    return Routemap(points=points, count=len(points))
+
+
+def generate_routemap_new(activities: list[dict], sampling_rate: int) -> np.ndarray:
+    builder = RoutemapBuilder(sampling_rate=sampling_rate)
+    for activity in activities:
+        builder.add_activity(activity)
+    cells, _ = builder.build_cells()
+    return cells
+
+
+def run(args: argparse.Namespace):
+    print(
+        f"{args.points_per_activity} points per activity, sampling every {args.sampling_rate} points"
+    )
+    print(
+        f"{'points':>10} {'old unique':>10} {'new unique':>10} {'old build':>10} {'old json':>9} {'new build':>10} {'new json':>9} {'speedup':>8}"
+    )
+    for point_count in args.points:
+        activities = [
+            {"strava_id": index, "route": route}
+            for index, route in enumerate(
+                make_routes(point_count, args.points_per_activity)
+            )
+        ]
+        gc.collect()
+
+        start = time.perf_counter()
+        routemap = generate_routemap_old(activities, args.sampling_rate)
+        old_build = time.perf_counter() - start
+        routemap.model_dump_json(by_alias=True)
+        old_total = time.perf_counter() - start
+        old_count = routemap.count
+        del routemap
+        gc.collect()
+
+        start = time.perf_counter()
+        cells = generate_routemap_new(activities, args.sampling_rate)
+        new_build = time.perf_counter() - start
+        orjson.dumps(cells_to_routemap_json(cells), option=orjson.OPT_SERIALIZE_NUMPY)
+        new_total = time.perf_counter() - start
+        new_count = len(cells)
+        del cells, activities
+
+        print(
+            f"{point_count:>10} {old_count:>10} {new_count:>10} {old_build:>9.3f}s {old_total - old_build:>8.3f}s "
+            f"{new_build:>9.3f}s {new_total - new_build:>8.3f}s {old_total / new_total:>7.1f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--points",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[10_000, 1_000_000, 10_000_000],
+    )
+    parser.add_argument("--points-per-activity", type=int, default=1000)
+    parser.add_argument("--sampling-rate", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark of the concurrent stream fetches of a sync against a local fake Strava server.
+
+Usage:
+    python -m bench.stream_concurrency [--activities 300] [--latency-ms 50] [--concurrency 1,2,5,10,20]
+
+The fake server answers the activity list and stream endpoints over HTTP on localhost after a fixed latency.
+Activities are listed and their streams fetched through the same `StravaApi`, `StravaHttpClient` and
+`SyncPipeline` stages as `sync_routes`, without the database, so the wall-clock time shows how the fetch
+stage scales with its number of workers.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import time
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Requests of the benchmark are not limited by the default Strava limits
+os.environ.setdefault("STRAVA_RATE_LIMIT_15MIN", "1000000")
+os.environ.setdefault("STRAVA_RATE_LIMIT_DAILY", "1000000")
+
+from api.utils.strava_api import StravaApi
+from api.utils.strava_client import StravaHttpClient
+from api.utils.sync_pipeline import SyncPipeline
+
+ROUTE_POINTS = 1000
+
+
+def fake_strava_app(activity_count: int, latency: float) -> Starlette:
+    activities = [
+        {
+            "id": 1000 + index,
+            "type": "Run",
+            "start_date": f"2024-01-01T{index % 24:02d}:00:00Z",
+        }
+        for index in range(activity_count)
+    ]
+    rng = random.Random(1)
+    route = [
+        [47.5 + rng.random() * 0.01, 19.0 + rng.random() * 0.01]
+        for _ in range(ROUTE_POINTS)
+    ]
+
+    async def list_activities(request: Request) -> JSONResponse:
+        await asyncio.sleep(latency)
+        page = int(request.query_params.get("page", 1))
+        per_page = int(request.query_params.get("per_page", 30))
+        return JSONResponse(activities[(page - 1) * per_page : page * per_page])
+
+    async def get_stream(request: Request) -> JSONResponse:
+        await asyncio.sleep(latency)
+        return JSONResponse({"latlng": {"data": route}})
+
+    return Starlette(
+        routes=[
+            Route("/athlete/activities", list_activities),
+            Route("/activities/{activity_id:int}/streams", get_stream),
+        ]
+    )
+
+
+async def fetch_all_streams(strava_client: StravaHttpClient, concurrency: int) -> int:
+    strava = StravaApi("benchmark", strava_client)
+    fetched = 0
+
+    async def fetch_stream(activity: dict) -> list:
+        nonlocal fetched
+        await strava.get_activity_latlng_stream(activity_id=activity["id"])
+        fetched += 1
+        return []
+
+    async def split_page(activities: list[dict]) -> list[dict]:
+        return activities
+
+    pipeline = SyncPipeline(100)
+    pipeline.source("list", strava.iter_activity_pages())
+    pipeline.stage("select", split_page)
+    pipeline.stage("fetch", fetch_stream, workers=concurrency)
+    await pipeline.run()
+    return fetched
+
+
+async def run(args: argparse.Namespace):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(
+            fake_strava_app(args.activities, args.latency_ms / 1000),
+            host="127.0.0.1",
+            port=port,
+            log_level="warning",
+        )
+    )
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    os.environ["STRAVA_API_URL"] = f"http://127.0.0.1:{port}"
+    strava_client = StravaHttpClient()
+    print(
+        f"{args.activities} activities, {args.latency_ms} ms latency per request, {ROUTE_POINTS} points per stream"
+    )
+    print(f"{'concurrency':>12} {'seconds':>9} {'streams/s':>10} {'speedup':>8}")
+    baseline = None
+    try:
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            fetched = await fetch_all_streams(strava_client, concurrency)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(
+                f"{concurrency:>12} {elapsed:>9.2f} {fetched / elapsed:>10.1f} {baseline / elapsed:>7.1f}x"
+            )
+    finally:
+        await strava_client.close()
+        server.should_exit = True
+        await server_task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--activities", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[1, 2, 5, 10, 20],
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
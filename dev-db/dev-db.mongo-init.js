@@ -14,3 +14,4 @@ db = db.getSiblingDB("strava");
 db.createCollection("users");
 db.createCollection("sync_metadata");
 db.createCollection("activities");
+db.createCollection("sync_jobs");